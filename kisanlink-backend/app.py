@@ -1,8 +1,17 @@
-import os
-from flask import Flask, send_from_directory
+from flask import Flask, jsonify
 from flask_cors import CORS
 from config import Config
 from extensions import db  # your SQLAlchemy instance
+from db import pool_stats  # raw psycopg2 connection pool
+from utils.spatial_index import spatial_index
+from utils.reservations import init_sweeper
+from utils.uploads import serve_upload
+from utils.metrics import init_metrics
+from utils.query_profiler import init_query_profiler
+from utils.request_profiler import init_request_profiler
+import models_stock_hold  # noqa: F401  (stock_holds table for create_all)
+import models_sales_rollup  # noqa: F401  (daily sales rollup tables for create_all)
+import models_recommendation  # noqa: F401  (consumer_recommendations for create_all)
 
 # Import Blueprints
 from routes.auth import auth_bp
@@ -33,15 +42,33 @@ CORS(app, origins=["http://localhost:3000", "http://localhost:3001"], supports_c
 # Initialize database
 db.init_app(app)
 
+# Expire cart stock holds in the background (thread starts on the first request)
+init_sweeper(app)
+
 # ------------------------------
-# Upload folder route
+# Upload folder route (the only one; see utils.uploads)
 # ------------------------------
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
-
-@app.route("/uploads/<filename>")
+@app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    """Serve uploaded images by filename."""
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    """Serve uploaded images with cache headers, ETags and Range support."""
+    return serve_upload(filename)
+
+# ------------------------------
+# Monitoring
+# ------------------------------
+@app.route("/health/db-pool")
+def db_pool_health():
+    """Connection pool stats: in-use, waiting, acquire latency."""
+    return jsonify(pool_stats())
+
+# Per-endpoint latency and DB-query metrics, Prometheus text on /metrics
+init_metrics(app)
+
+# Slow-query / N+1 log (off unless QUERY_PROFILER_ENABLED)
+init_query_profiler(app)
+
+# On-demand profile of single requests (off unless REQUEST_PROFILER_ENABLED)
+init_request_profiler(app)
 
 # ------------------------------
 # Register Blueprints
@@ -63,4 +90,5 @@ app.register_blueprint(notifications_bp, url_prefix="/notifications")
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()  # Create tables if not exist (SQLAlchemy)
+    spatial_index.rebuild()  # Warm the nearby-search index (otherwise built on first query)
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Checkout contention benchmark.
+
+Many consumers check out the same scarce product at once. Reports checkout
+throughput and latency, and verifies that stock never goes negative and
+exactly min(consumers, stock) orders succeed.
+
+Needs a scratch Postgres database (tables are created, rows are added):
+
+    python -m benchmarks.checkout_contention --db-url postgresql://user:pw@localhost/kisanlink_bench \
+        --consumers 500 --stock 200 --workers 32
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from extensions import db
+from models_cart import CartItem
+from models_farmer_items import FarmerItem
+from models_user import User
+from models_order import Order, OrderItem  # noqa: F401  (create_all)
+from models_notification import Notification  # noqa: F401  (create_all)
+from routes.cart import cart_bp
+
+
+def make_app(db_url, pool_size):
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": pool_size, "max_overflow": 0}
+    db.init_app(app)
+    app.register_blueprint(cart_bp, url_prefix="/cart")
+    return app
+
+
+def seed(app, consumers, stock):
+    tag = uuid.uuid4().hex[:8]
+    with app.app_context():
+        db.create_all()
+        farmer = User(fullname="Bench Farmer", username=f"bench-farmer-{tag}",
+                      email=f"farmer-{tag}@bench.local", password="x")
+        db.session.add(farmer)
+        db.session.flush()
+        product = FarmerItem(farmer_id=farmer.id, item_name=f"Tomato {tag}", price=50,
+                             min_order_qty=1, available_stock=stock)
+        db.session.add(product)
+        db.session.flush()
+
+        users = [User(fullname=f"Consumer {i}", username=f"bench-{tag}-{i}",
+                      email=f"c{i}-{tag}@bench.local", password="x") for i in range(consumers)]
+        db.session.add_all(users)
+        db.session.flush()
+        carts = [CartItem(consumer_id=u.id, product_id=product.id, quantity=1) for u in users]
+        db.session.add_all(carts)
+        db.session.commit()
+        return product.id, [(u.id, c.id) for u, c in zip(users, carts)]
+
+
+def checkout_one(app, consumer_id, cart_id):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = consumer_id
+    started = time.perf_counter()
+    resp = client.post("/cart/checkout", json={"item_ids": [cart_id]})
+    return resp.status_code, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=os.environ.get("BENCH_DATABASE_URL"), required="BENCH_DATABASE_URL" not in os.environ)
+    parser.add_argument("--consumers", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    app = make_app(args.db_url, args.workers)
+    product_id, lines = seed(app, args.consumers, args.stock)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda line: checkout_one(app, *line), lines))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(1 for status, _ in results if status == 200)
+    rejected = sum(1 for status, _ in results if status == 409)
+    errors = len(results) - ok - rejected
+    latencies = sorted(t * 1000 for _, t in results)
+
+    with app.app_context():
+        final_stock = db.session.get(FarmerItem, product_id).available_stock
+
+    print(f"checkouts: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), {args.workers} workers")
+    print(f"placed: {ok}  sold out: {rejected}  errors: {errors}")
+    print(f"latency ms: p50 {statistics.median(latencies):.1f}  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}  max {latencies[-1]:.1f}")
+    print(f"stock: {args.stock} -> {final_stock}")
+
+    expected = min(args.consumers, args.stock)
+    if ok != expected or final_stock != args.stock - ok or errors:
+        print(f"FAIL: expected {expected} orders and no errors")
+        sys.exit(1)
+    print("OK: no overselling")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Distance-based recommendation benchmark.
+
+Places --farmers farmers (default 10k) with --products products each at
+random points in a --span-deg square, loads the in-process spatial index
+directly, and times distance_based_recommend for random customer
+locations. Also times the pure-Python scoring path for comparison.
+
+Runs against an in-memory SQLite database by default, or any database
+given with --db-url (tables are created, rows are added):
+
+    python -m benchmarks.distance_recommend --farmers 10000 --products 5 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from config import Config
+from extensions import db
+from models_farmer_items import FarmerItem
+from models_sales_rollup import DailyFarmerSales
+import utils.recommenders as recommenders
+from utils.spatial_index import spatial_index
+
+
+def seed(app, farmers, products, span_deg, rng):
+    with app.app_context():
+        db.create_all()
+        base = (db.session.query(db.func.max(FarmerItem.farmer_id)).scalar() or 0) + 1
+        locations = {}
+        items, sales = [], []
+        for f in range(base, base + farmers):
+            locations[f] = (17 + rng.random() * span_deg, 78 + rng.random() * span_deg)
+            for p in range(products):
+                items.append({"farmer_id": f, "item_name": f"Item {p}", "price": rng.randint(10, 200),
+                              "min_order_qty": 1, "available_stock": rng.randint(0, 100)})
+        db.session.execute(insert(FarmerItem), items)
+        for product_id, farmer_id in db.session.query(FarmerItem.id, FarmerItem.farmer_id).filter(
+                FarmerItem.farmer_id >= base):
+            if rng.random() < 0.5:
+                sales.append({"farmer_id": farmer_id, "product_id": product_id, "day": date.today(),
+                              "quantity": rng.randint(1, 50), "revenue": 0})
+        db.session.execute(insert(DailyFarmerSales), sales)
+        db.session.commit()
+
+    # Load the index directly instead of from users (no drift checks during the run)
+    for farmer_id, (lat, lon) in locations.items():
+        spatial_index.set_farmer(farmer_id, lat, lon)
+    spatial_index._built = True
+    spatial_index.drift_check_seconds = float("inf")
+    return len(items)
+
+
+def run(app, queries, span_deg, k, radius_km, rng):
+    timings = []
+    with app.app_context():
+        for _ in range(queries):
+            location = (17 + rng.random() * span_deg, 78 + rng.random() * span_deg)
+            started = time.perf_counter()
+            recommenders.distance_based_recommend(location, k=k, radius_km=radius_km)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings
+
+
+def report(label, timings):
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label}: p50 {statistics.median(timings):.2f} ms  p95 {p95:.2f} ms  max {timings[-1]:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=os.environ.get("BENCH_DATABASE_URL", "sqlite://"))
+    parser.add_argument("--farmers", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--span-deg", type=float, default=5.0, help="side of the square farmers are spread over")
+    parser.add_argument("--k", type=int, default=Config.RECOMMENDER_NEAREST_FARMERS)
+    parser.add_argument("--radius-km", type=float, default=Config.RECOMMENDER_RADIUS_KM)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.db_url
+    db.init_app(app)
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    items = seed(app, args.farmers, args.products, args.span_deg, rng)
+    print(f"seeded {args.farmers} farmers, {items} products in {time.perf_counter() - started:.1f} s")
+
+    report(f"k={args.k} radius={args.radius_km} km", run(app, args.queries, args.span_deg, args.k, args.radius_km, rng))
+    report(f"k={args.k * 10} radius={args.radius_km} km", run(app, args.queries, args.span_deg, args.k * 10, args.radius_km, rng))
+
+    if recommenders.np is not None:
+        recommenders.np = None   # same queries through the plain-Python scoring path
+        report(f"k={args.k * 10} pure Python", run(app, args.queries, args.span_deg, args.k * 10, args.radius_km, rng))
+
+
+if __name__ == "__main__":
+    main()
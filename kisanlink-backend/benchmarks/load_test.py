@@ -0,0 +1,470 @@
+"""
+End-to-end load benchmark.
+
+Seeds a scratch database with a synthetic marketplace (farmers, products,
+consumers, orders, carts, notifications), then drives the real app (app.py)
+with a weighted mix of user actions from concurrent virtual users and
+reports p50/p95/p99 latency and throughput per endpoint.
+
+Runs against the SQLite file instance/loadtest.db by default, or the
+database given with --db-url / BENCH_DATABASE_URL (tables are created,
+rows are added). Seed once, then run as often as needed:
+
+    python -m benchmarks.load_test seed --scale 100k
+    python -m benchmarks.load_test run --workers 16 --duration 60 --save baseline.json
+    python -m benchmarks.load_test run --server --compare baseline.json
+
+--scale is the number of orders (1k .. 1m); farmers, products, consumers,
+cart lines and notifications are derived from it. Requests go through the
+Flask test client by default, --server starts a local threaded WSGI server
+and sends real HTTP, --url targets a server that is already running
+against the same database. Virtual users are logged in by signing their
+session cookie (login itself needs the users.password_hash schema).
+The report endpoint reads through the psycopg2 pool, so it only runs on
+Postgres; on SQLite it is left out of the mix.
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import MetaData, Table, insert, inspect, make_url, text
+from config import Config
+
+DEFAULT_DB = "sqlite:///" + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                         "instance", "loadtest.db")
+DEFAULT_MIX = "browse=50,add_to_cart=20,view_cart=10,checkout=8,notifications=7,report=5"
+CHUNK = 10_000
+
+# Farmers and consumers are spread over this box (Telangana / Maharashtra)
+LAT_RANGE = (16.0, 21.0)
+LON_RANGE = (74.0, 80.0)
+
+
+def parse_scale(value):
+    value = value.strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(value[-1], 1)
+    return int(float(value.rstrip("km")) * factor)
+
+
+def configure(db_url, workers):
+    """Point the app (SQLAlchemy and the psycopg2 pool) at the benchmark database; call before importing app."""
+    url = make_url(db_url)
+    Config.SQLALCHEMY_DATABASE_URI = db_url
+    options = {"pool_size": workers + 2, "max_overflow": 0, "pool_timeout": 30, "pool_pre_ping": True}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"timeout": 30, "check_same_thread": False}
+    else:
+        Config.DB_HOST = url.host or "localhost"
+        Config.DB_PORT = url.port or 5432
+        Config.DB_NAME = url.database
+        Config.DB_USER = url.username
+        Config.DB_PASSWORD = url.password
+        Config.DB_POOL_MAX = max(Config.DB_POOL_MAX, workers + 2)
+    Config.SQLALCHEMY_ENGINE_OPTIONS = options
+    return url.get_backend_name()
+
+
+# -----------------------------
+# Seeding
+# -----------------------------
+def ensure_user_columns(engine):
+    """The location/role columns the raw-SQL routes use; create_all's users table lacks them."""
+    existing = {c["name"] for c in inspect(engine).get_columns("users")}
+    with engine.begin() as conn:
+        for name, sql_type in (("user_type", "VARCHAR(20)"), ("location", "VARCHAR(255)"),
+                               ("latitude", "FLOAT"), ("longitude", "FLOAT")):
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} {sql_type}"))
+
+
+def insert_returning_ids(table, rows):
+    from extensions import db
+    ids = []
+    for start in range(0, len(rows), CHUNK):
+        ids.extend(db.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows[start:start + CHUNK]
+        ).scalars().all())
+    return ids
+
+
+def seed(app, scale, rng):
+    from extensions import db
+    from models_cart import CartItem
+    from models_notification import Notification
+    from models_order import Order, OrderItem
+    from utils.sales_rollup import backfill
+
+    farmers = max(10, scale // 100)
+    products_per_farmer = 10
+    consumers = max(50, scale // 10)
+    tag = f"{int(time.time()):x}"
+    now = datetime.utcnow()
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                conn.execute(text("PRAGMA journal_mode=WAL"))
+        db.create_all()
+        ensure_user_columns(engine)
+        users = Table("users", MetaData(), autoload_with=engine)
+
+        def person(kind, i):
+            lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+            return {"fullname": f"Load {kind.title()} {i}", "username": f"load-{kind}-{tag}-{i}",
+                    "email": f"load-{kind}-{tag}-{i}@bench.local", "password": "x", "user_type": kind,
+                    "location": f"{lat:.4f},{lon:.4f}", "latitude": lat, "longitude": lon}
+
+        started = time.perf_counter()
+        farmer_rows = [person("farmer", i) for i in range(farmers)]
+        farmer_ids = insert_returning_ids(users, farmer_rows)
+        consumer_ids = insert_returning_ids(users, [person("consumer", i) for i in range(consumers)])
+        db.session.commit()
+        print(f"  users: {farmers} farmers, {consumers} consumers")
+
+        catalog = {}   # farmer id -> [(product id, price)]
+        items = Table("farmer_items", MetaData(), autoload_with=engine)
+        product_rows = [
+            {"farmer_id": fid, "item_name": f"Produce {p}", "price": rng.randint(10, 200),
+             "location": row["location"], "latitude": row["latitude"], "longitude": row["longitude"],
+             "min_order_qty": 1, "available_stock": 100_000}
+            for fid, row in zip(farmer_ids, farmer_rows) for p in range(products_per_farmer)
+        ]
+        for row, pid in zip(product_rows, insert_returning_ids(items, product_rows)):
+            catalog.setdefault(row["farmer_id"], []).append((pid, row["price"]))
+        db.session.commit()
+        print(f"  farmer_items: {len(product_rows)}")
+
+        # Orders: one farmer each (as checkout writes them), 1-3 lines, spread over the last year
+        orders_table = Order.__table__
+        for start in range(0, scale, CHUNK):
+            batch = []
+            for _ in range(min(CHUNK, scale - start)):
+                fid = rng.choice(farmer_ids)
+                lines = [(pid, price, rng.randint(1, 5)) for pid, price in rng.sample(catalog[fid], rng.randint(1, 3))]
+                batch.append((fid, lines))
+            order_ids = insert_returning_ids(orders_table, [
+                {"consumer_id": rng.choice(consumer_ids), "total_amount": sum(p * q for _, p, q in lines),
+                 "status": "Delivered", "created_at": now - timedelta(seconds=rng.randint(0, 365 * 86400))}
+                for _, lines in batch
+            ])
+            db.session.execute(insert(OrderItem), [
+                {"order_id": oid, "product_id": pid, "farmer_id": fid, "quantity": qty, "price": price}
+                for oid, (fid, lines) in zip(order_ids, batch) for pid, price, qty in lines
+            ])
+            db.session.commit()
+        print(f"  orders: {scale}")
+
+        people = farmer_ids + consumer_ids
+        for start in range(0, scale, CHUNK):
+            db.session.execute(insert(Notification), [
+                {"user_id": rng.choice(people), "message": "Your order has been placed successfully",
+                 "is_read": rng.random() < 0.7, "created_at": now - timedelta(seconds=rng.randint(0, 90 * 86400))}
+                for _ in range(min(CHUNK, scale - start))
+            ])
+            db.session.commit()
+        print(f"  notifications: {scale}")
+
+        all_products = [pid for lines in catalog.values() for pid, _ in lines]
+        for start in range(0, consumers, CHUNK):
+            db.session.execute(insert(CartItem), [
+                {"consumer_id": cid, "product_id": rng.choice(all_products), "quantity": rng.randint(1, 3)}
+                for cid in consumer_ids[start:start + CHUNK] if rng.random() < 0.5
+            ])
+            db.session.commit()
+        print("  cart_items: ~50% of consumers")
+
+        backfill()
+        if engine.dialect.name == "postgresql":
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+        print(f"seeded in {time.perf_counter() - started:.1f} s")
+
+
+# -----------------------------
+# Virtual users
+# -----------------------------
+def load_population(app):
+    """Consumers, farmers and products to act on, and the spatial index loaded from the same rows."""
+    from extensions import db
+    from utils.spatial_index import spatial_index
+
+    with app.app_context():
+        farmers = db.session.execute(text(
+            "SELECT id, latitude, longitude FROM users "
+            "WHERE user_type = 'farmer' AND latitude IS NOT NULL AND longitude IS NOT NULL")).all()
+        consumers = db.session.execute(text(
+            "SELECT id, latitude, longitude FROM users "
+            "WHERE user_type = 'consumer' AND latitude IS NOT NULL AND longitude IS NOT NULL "
+            "ORDER BY id DESC LIMIT 50000")).all()
+        products = db.session.execute(text("SELECT id, farmer_id FROM farmer_items")).all()
+
+    # Load the index directly (the drift check reads through the psycopg2 pool, not available on SQLite)
+    for farmer_id, lat, lon in farmers:
+        spatial_index.set_farmer(farmer_id, lat, lon)
+    for product_id, farmer_id in products:
+        spatial_index.set_product(product_id, farmer_id)
+    spatial_index._built = True
+    spatial_index.drift_check_seconds = float("inf")
+    if not consumers or not products:
+        sys.exit("No seeded data found; run `python -m benchmarks.load_test seed` first")
+    return consumers, [f for f, _, _ in farmers], [p for p, _ in products]
+
+
+class TestClientTransport:
+    def __init__(self, app, user_id):
+        self.client = app.test_client()
+        with self.client.session_transaction() as s:
+            s["user_id"] = user_id
+            s["user_type"] = "consumer"
+
+    def request(self, method, path, body=None):
+        resp = self.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+
+
+class HttpTransport:
+    def __init__(self, app, user_id, base_url):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        cookie = app.session_interface.get_signing_serializer(app).dumps({"user_id": user_id, "user_type": "consumer"})
+        self.headers = {"Cookie": f"{app.config['SESSION_COOKIE_NAME']}={cookie}", "Content-Type": "application/json"}
+
+    def request(self, method, path, body=None):
+        try:
+            self.conn.request(method, path, body=None if body is None else json.dumps(body), headers=self.headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        try:
+            return resp.status, json.loads(data)
+        except ValueError:
+            return resp.status, None
+
+
+class VirtualUser:
+    """One consumer session; each action issues one or two requests and records them under a route label."""
+
+    def __init__(self, transport, consumer, farmers, products, rng, record):
+        self.t = transport
+        self.user_id, self.lat, self.lon = consumer
+        self.farmers, self.products = farmers, products
+        self.rng = rng
+        self.record = record
+        self.cart_ids = []
+        self.nearby = []
+
+    def _call(self, label, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data = self.t.request(method, path, body)
+        except Exception:
+            status, data = 599, None
+        self.record(label, time.perf_counter() - started, status)
+        return status, data
+
+    def browse(self):
+        status, data = self._call("GET /consumer/nearby-products", "GET",
+                                  f"/consumer/nearby-products?lat={self.lat:.3f}&lon={self.lon:.3f}&radius_km=50&limit=50")
+        if status == 200 and data:
+            self.nearby = [p["id"] for p in data]
+
+    def add_to_cart(self):
+        product_id = self.rng.choice(self.nearby or self.products)
+        status, data = self._call("POST /cart/", "POST", "/cart/?delta=1", {"product_id": product_id, "quantity": 1})
+        if status == 200 and data:
+            self.cart_ids.extend(line["id"] for line in data.get("changed", []) if line["id"] not in self.cart_ids)
+
+    def view_cart(self):
+        status, data = self._call("GET /cart/", "GET", "/cart/")
+        if status == 200 and isinstance(data, list):
+            self.cart_ids = [line["id"] for line in data]
+
+    def checkout(self):
+        if not self.cart_ids:
+            self.view_cart()
+        if not self.cart_ids:
+            self.add_to_cart()
+        if self.cart_ids:
+            self._call("POST /cart/checkout", "POST", "/cart/checkout", {"item_ids": self.cart_ids})
+            self.cart_ids = []
+
+    def notifications(self):
+        self._call("GET /notifications/unread-count", "GET", "/notifications/unread-count")
+
+    def report(self):
+        self._call("GET /api/farmer/report/<id>", "GET", f"/api/farmer/report/{self.rng.choice(self.farmers)}")
+
+
+class Stats:
+    def __init__(self):
+        self.samples = {}   # label -> [(seconds, status)]
+        self._lock = threading.Lock()
+        self.recording = False
+
+    def record(self, label, seconds, status):
+        if self.recording:
+            with self._lock:
+                self.samples.setdefault(label, []).append((seconds, status))
+
+
+def percentile(sorted_values, p):
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values)) - 1))]
+
+
+def summarize(stats, elapsed):
+    result = {}
+    for label, samples in sorted(stats.samples.items()):
+        ms = sorted(s * 1000 for s, _ in samples)
+        result[label] = {
+            "count": len(samples),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50": round(percentile(ms, 0.50), 2),
+            "p95": round(percentile(ms, 0.95), 2),
+            "p99": round(percentile(ms, 0.99), 2),
+            "max": round(ms[-1], 2),
+            "4xx": sum(1 for _, status in samples if 400 <= status < 500),
+            "errors": sum(1 for _, status in samples if status >= 500),
+        }
+    return result
+
+
+def print_table(result, elapsed):
+    print(f"{'endpoint':34} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'4xx':>5} {'5xx':>5}")
+    for label, r in result.items():
+        print(f"{label:34} {r['count']:>7} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} "
+              f"{r['max']:>8.1f} {r['4xx']:>5} {r['errors']:>5}")
+    total = sum(r["count"] for r in result.values())
+    print(f"total: {total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s)")
+
+
+def compare(result, baseline_path, tolerance, floor_ms=1.0):
+    """Endpoints whose p95 grew by more than `tolerance` (and at least floor_ms) over the baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["endpoints"]
+    regressions = []
+    for label, r in result.items():
+        base = baseline.get(label)
+        if base and r["p95"] > base["p95"] * (1 + tolerance) and r["p95"] - base["p95"] > floor_ms:
+            regressions.append(f"{label}: p95 {base['p95']:.1f} -> {r['p95']:.1f} ms")
+    return regressions
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no per-request access log
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run(app, backend, args):
+    mix = {}
+    for part in args.mix.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    if backend != "postgresql" and mix.pop("report", None):
+        print("note: report endpoint skipped (needs Postgres)")
+    unknown = set(mix) - {name for name in vars(VirtualUser) if not name.startswith("_")}
+    if unknown:
+        sys.exit(f"Unknown actions in --mix: {', '.join(sorted(unknown))}")
+    actions, weights = list(mix), list(mix.values())
+
+    consumers, farmers, products = load_population(app)
+    server = None
+    base_url = args.url
+    if args.server:
+        server, base_url = start_server(app)
+    print(f"{args.workers} virtual users, {'HTTP ' + base_url if base_url else 'test client'}, "
+          f"{args.warmup:g} s warm-up + {args.duration:g} s")
+
+    stats = Stats()
+    deadline = time.monotonic() + args.warmup + args.duration
+
+    def worker(n):
+        rng = random.Random(args.seed * 1000 + n)
+        consumer = tuple(rng.choice(consumers))
+        transport = HttpTransport(app, consumer[0], base_url) if base_url else TestClientTransport(app, consumer[0])
+        user = VirtualUser(transport, consumer, farmers, products, rng, stats.record)
+        while time.monotonic() < deadline:
+            getattr(user, rng.choices(actions, weights)[0])()
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(args.workers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    stats.recording = True
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if server is not None:
+        server.shutdown()
+
+    result = summarize(stats, elapsed)
+    print_table(result, elapsed)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": {"db": backend, "workers": args.workers, "duration": args.duration,
+                                "mix": args.mix, "transport": "http" if base_url else "test-client"},
+                       "endpoints": result}, f, indent=2)
+        print(f"saved {args.save}")
+    failed = any(r["errors"] for r in result.values())
+    if args.compare:
+        regressions = compare(result, args.compare, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        failed = failed or bool(regressions)
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=os.environ.get("BENCH_DATABASE_URL", DEFAULT_DB))
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed_cmd = sub.add_parser("seed", help="add a synthetic marketplace to the database")
+    seed_cmd.add_argument("--scale", default="10k", help="number of orders, e.g. 1k, 100k, 1m")
+
+    run_cmd = sub.add_parser("run", help="drive the app with concurrent virtual users")
+    run_cmd.add_argument("--workers", type=int, default=8)
+    run_cmd.add_argument("--duration", type=float, default=30, help="measured seconds")
+    run_cmd.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    run_cmd.add_argument("--mix", default=DEFAULT_MIX, help="action=weight,... (browse, add_to_cart, "
+                                                           "view_cart, checkout, notifications, report)")
+    run_cmd.add_argument("--server", action="store_true", help="serve the app over local HTTP (threaded WSGI)")
+    run_cmd.add_argument("--url", help="send requests to an already running server instead")
+    run_cmd.add_argument("--save", help="write per-endpoint results as JSON")
+    run_cmd.add_argument("--compare", help="baseline JSON from --save; exit 1 on p95 regressions")
+    run_cmd.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    if args.db_url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(args.db_url[len("sqlite:///"):]) or ".", exist_ok=True)
+    backend = configure(args.db_url, getattr(args, "workers", 1))
+    from app import app   # after configure(): app.py reads Config at import
+
+    if args.command == "seed":
+        print(f"seeding {args.db_url} at scale {args.scale}")
+        seed(app, parse_scale(args.scale), random.Random(args.seed))
+    else:
+        run(app, backend, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Farmer report benchmark.
+
+Seeds one farmer with --orders orders (default 100k) in a scratch Postgres
+database, builds the daily rollups from them, and times build_report,
+counting the queries it issues.
+
+    python -m benchmarks.report_queries --db-url postgresql://user:pw@localhost/kisanlink_bench --orders 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import psycopg2.extensions
+from flask import Flask
+from extensions import db
+from models_user import User  # noqa: F401  (create_all)
+from models_farmer_items import FarmerItem  # noqa: F401
+from models_order import Order, OrderItem  # noqa: F401
+from models_sales_rollup import DailyFarmerSales  # noqa: F401
+from routes.report import build_report
+from utils.sales_rollup import backfill
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    executed = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.executed += 1
+        return super().execute(query, vars)
+
+
+def seed(db_url, orders, products):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        farmer_id = db.session.execute(db.text("""
+            INSERT INTO users (fullname, username, email, password)
+            VALUES ('Bench Farmer', 'bench-farmer', 'bench-' || md5(random()::text) || '@bench.local', 'x')
+            RETURNING id
+        """)).scalar()
+        db.session.execute(db.text("""
+            INSERT INTO farmer_items (farmer_id, item_name, price, min_order_qty, available_stock)
+            SELECT :farmer_id, 'Product ' || g, 10 + g, 1, (g * 7) % 40
+            FROM generate_series(1, :products) g
+        """), {"farmer_id": farmer_id, "products": products})
+        db.session.execute(db.text("""
+            INSERT INTO orders (consumer_id, total_amount, status, created_at)
+            SELECT 1, 0, 'Pending', now() - (g % 365) * interval '1 day'
+            FROM generate_series(1, :orders) g
+        """), {"orders": orders})
+        db.session.execute(db.text("""
+            INSERT INTO order_items (order_id, product_id, farmer_id, quantity, price)
+            SELECT o.id, fi.id, :farmer_id, 1 + o.id % 5, fi.price
+            FROM (SELECT id, row_number() OVER () AS n FROM orders ORDER BY id DESC LIMIT :orders) o
+            JOIN (SELECT id, price, row_number() OVER (ORDER BY id) - 1 AS k
+                  FROM farmer_items WHERE farmer_id = :farmer_id) fi
+              ON fi.k = o.n % :products
+        """), {"farmer_id": farmer_id, "orders": orders, "products": products})
+        db.session.commit()
+        backfill(farmer_id)
+        db.session.execute(db.text("ANALYZE"))
+        return farmer_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default=os.environ.get("BENCH_DATABASE_URL"), required="BENCH_DATABASE_URL" not in os.environ)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    farmer_id = seed(args.db_url, args.orders, args.products)
+    conn = psycopg2.connect(args.db_url, cursor_factory=CountingCursor)
+
+    build_report(conn, farmer_id)   # warm cache
+    CountingCursor.executed = 0
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        report = build_report(conn, farmer_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    conn.close()
+
+    print(f"farmer {farmer_id}: {report['summary']['totalOrders']} orders, {len(report['inventoryTable'])} products")
+    print(f"queries per report: {CountingCursor.executed / args.runs:g}")
+    print(f"latency ms: p50 {statistics.median(timings):.1f}  max {max(timings):.1f}  ({args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,254 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions as pg_ext
 from flask_sqlalchemy import SQLAlchemy
+from config import Config
+
 db = SQLAlchemy()
 
-def get_db_connection():
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within DB_POOL_TIMEOUT."""
+
+
+# -----------------------------
+# Query hooks (metrics, profiling)
+# -----------------------------
+_query_hooks = []
+
+
+def add_query_hook(hook):
+    """hook(driver, statement, params, seconds) runs after every pooled-cursor query."""
+    _query_hooks.append(hook)
+
+
+class InstrumentedCursor(pg_ext.cursor):
+    """Cursor that reports each execute/executemany to the query hooks (no-op when none)."""
+
+    def _timed(self, run, query, vars):
+        if not _query_hooks:
+            return run(query, vars)
+        started = time.perf_counter()
+        try:
+            return run(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in _query_hooks:
+                hook("psycopg2", query, vars, elapsed)
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+
+# -----------------------------
+# Connection pool
+# -----------------------------
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+    - Opens `minconn` connections up front and never more than `maxconn`
+    - Callers wait up to `timeout` seconds for a free connection
+    - Connections idle longer than `ping_after` are checked with SELECT 1
+    - Connections are closed and replaced after `recycle_uses` checkouts
+    """
+
+    def __init__(self, minconn, maxconn, timeout, ping_after, recycle_uses, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.recycle_uses = recycle_uses
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, last_released_at)]
+        self._uses = {}        # id(conn) -> number of checkouts
+        self._open = 0         # connections currently open (idle + in use)
+        self._waiting = 0
+
+        # Stats for monitoring
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._acquire_seconds_total = 0.0
+        self._acquire_seconds_max = 0.0
+
+        for _ in range(minconn):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                print(f"Database connection error: {e}")
+                break
+            self._open += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _discard(self, conn):
+        """Close a connection and free its slot. Caller must hold the lock."""
+        self._uses.pop(id(conn), None)
+        self._open -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._cond.notify()
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _take(self, deadline):
+        """
+        Pop an idle connection or reserve a slot for a new one.
+        Returns (conn, idle_since) or (None, None) when a slot was reserved.
+        """
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        return self._idle.pop()   # most recently released first
+                    if self._open < self.maxconn:
+                        self._open += 1
+                        return None, None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts_total += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            conn, idle_since = self._take(deadline)
+
+            # Connecting and pinging happen outside the lock so one slow
+            # handshake doesn't stall every other request
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, idle_since):
+                with self._cond:
+                    self._discard(conn)
+                continue
+
+            with self._cond:
+                self._uses[id(conn)] = self._uses.get(id(conn), 0) + 1
+                elapsed = time.monotonic() - started
+                self._acquired_total += 1
+                self._acquire_seconds_total += elapsed
+                self._acquire_seconds_max = max(self._acquire_seconds_max, elapsed)
+            return conn
+
+    def release(self, conn):
+        # Never hand a connection with an open transaction to the next caller
+        if not conn.closed and conn.get_transaction_status() != pg_ext.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+        with self._cond:
+            if conn.closed or self._uses.get(id(conn), 0) >= self.recycle_uses:
+                self._discard(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            acquired = self._acquired_total
+            return {
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                "waiting": self._waiting,
+                "max": self.maxconn,
+                "acquired_total": acquired,
+                "timeouts_total": self._timeouts_total,
+                "acquire_ms_avg": round(self._acquire_seconds_total / acquired * 1000, 3) if acquired else 0.0,
+                "acquire_ms_max": round(self._acquire_seconds_max * 1000, 3),
+            }
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    minconn=Config.DB_POOL_MIN,
+                    maxconn=Config.DB_POOL_MAX,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    ping_after=Config.DB_POOL_PING_AFTER,
+                    recycle_uses=Config.DB_POOL_RECYCLE_USES,
+                    host=Config.DB_HOST,
+                    port=Config.DB_PORT,
+                    database=Config.DB_NAME,
+                    user=Config.DB_USER,
+                    password=Config.DB_PASSWORD,
+                    cursor_factory=InstrumentedCursor,
+                )
+    return _pool
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a pooled connection:
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            ...
+            conn.commit()
+
+    Uncommitted work is rolled back when the block exits.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database="kisanlink_db",
-            user="kisanlink_user",
-            password="password123"
-        )
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def pool_stats():
+    return get_pool().stats()
@@ -0,0 +1,47 @@
+# kisanlink-backend/models_chat.py
+from extensions import db
+from datetime import datetime
+
+def conversation_key(user_a, user_b):
+    """Same key for both directions of a farmer/consumer conversation."""
+    low, high = sorted((user_a, user_b))
+    return f"{low}:{high}"
+
+
+class Message(db.Model):
+    __tablename__ = "messages"
+
+    id = db.Column(db.Integer, primary_key=True)
+    conversation = db.Column(db.String(50), nullable=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    receiver_id = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # History pages of one conversation
+        db.Index("ix_messages_conversation_timestamp", "conversation", "timestamp", "id"),
+        # Long-poll: "anything for me after id X"
+        db.Index("ix_messages_receiver_id", "receiver_id", "id"),
+    )
+
+
+class ChatThread(db.Model):
+    """
+    One row per (user, peer): denormalized last message and unread count,
+    so the conversation list is a single indexed query.
+    """
+    __tablename__ = "chat_threads"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    peer_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_message = db.Column(db.String(200))
+    last_at = db.Column(db.DateTime)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "peer_id", name="uq_chat_threads_user_peer"),
+        db.Index("ix_chat_threads_user_last_at", "user_id", "last_at"),
+    )
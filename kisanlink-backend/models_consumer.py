@@ -49,16 +49,6 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer)
 
 
-class Message(db.Model):
-    __tablename__ = "messages"
-
-    id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer)
-    receiver_id = db.Column(db.Integer)
-    content = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-
-
 class Notification(db.Model):
     __tablename__ = "notifications"
 
@@ -4,10 +4,12 @@ class FarmerItem(db.Model):
     __tablename__ = "farmer_items"
 
     id = db.Column(db.Integer, primary_key=True)
-    farmer_id = db.Column(db.Integer, nullable=False)
+    farmer_id = db.Column(db.Integer, nullable=False, index=True)
     item_name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
-    photo_path = db.Column(db.String(255))
+    photo_path = db.Column(db.String(255))    # original, named by content hash
+    thumb_path = db.Column(db.String(255))    # 320x320 WebP, set once generated
+    medium_path = db.Column(db.String(255))   # max 1024 px WebP
     location = db.Column(db.String(255))
     min_order_qty = db.Column(db.Integer, default=1)
     available_stock = db.Column(db.Integer, default=0)
@@ -11,3 +11,26 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship("User", backref="notifications")
+
+    __table_args__ = (
+        # Newest-first pages for one user: index range scan, no sort
+        db.Index("ix_notifications_user_created", "user_id", "created_at", "id"),
+        # Unread count only touches unread rows
+        db.Index(
+            "ix_notifications_user_unread", "user_id",
+            postgresql_where=db.text("is_read = false"),
+            sqlite_where=db.text("is_read = 0"),
+        ),
+    )
+
+
+class NotificationArchive(db.Model):
+    """Old, read notifications moved out of the hot table by the retention job."""
+    __tablename__ = "notifications_archive"
+
+    id = db.Column(db.Integer, primary_key=True)   # same id as in notifications
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    message = db.Column(db.String(500), nullable=False)
+    is_read = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
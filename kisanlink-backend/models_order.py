@@ -5,7 +5,7 @@ from datetime import datetime
 class Order(db.Model):
     __tablename__ = "orders"
     id = db.Column(db.Integer, primary_key=True)
-    consumer_id = db.Column(db.Integer, nullable=False)
+    consumer_id = db.Column(db.Integer, nullable=False, index=True)   # get_customer_type lookups
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default="Pending")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -21,3 +21,8 @@ class OrderItem(db.Model):
     farmer_id = db.Column(db.Integer, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        # Farmer reports read all of one farmer's lines
+        db.Index("ix_order_items_farmer_order", "farmer_id", "order_id"),
+    )
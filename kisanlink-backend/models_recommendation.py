@@ -0,0 +1,12 @@
+# kisanlink-backend/models_recommendation.py
+from extensions import db
+from datetime import datetime
+
+class ConsumerRecommendation(db.Model):
+    """Precomputed top-N products for one consumer (flask recommend precompute)."""
+    __tablename__ = "consumer_recommendations"
+
+    consumer_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)      # "history" or "distance"
+    product_ids = db.Column(db.JSON, nullable=False)      # best first
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,22 @@
+# kisanlink-backend/models_sales_rollup.py
+from extensions import db
+
+class DailyFarmerSales(db.Model):
+    """Per farmer, product and day: units sold and revenue (rollup of order_items)."""
+    __tablename__ = "daily_farmer_sales"
+
+    farmer_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+
+class DailyFarmerOrders(db.Model):
+    """Per farmer and day: distinct orders and revenue (feeds the sales trend and totals)."""
+    __tablename__ = "daily_farmer_orders"
+
+    farmer_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
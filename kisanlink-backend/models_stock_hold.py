@@ -0,0 +1,23 @@
+# kisanlink-backend/models_stock_hold.py
+from extensions import db
+from datetime import datetime
+
+class StockHold(db.Model):
+    """Time-boxed reservation of farmer_items stock by a consumer's cart."""
+    __tablename__ = "stock_holds"
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("farmer_items.id", ondelete="CASCADE"), nullable=False)
+    consumer_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # One hold per consumer and product; re-adding refreshes it
+        db.UniqueConstraint("consumer_id", "product_id", name="uq_stock_holds_consumer_product"),
+        # SUM(quantity) of live holds per product is an index range scan
+        db.Index("ix_stock_holds_product_expires", "product_id", "expires_at", "quantity"),
+        # Sweeper deletes by expiry
+        db.Index("ix_stock_holds_expires", "expires_at"),
+    )
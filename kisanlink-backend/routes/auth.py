@@ -3,7 +3,9 @@
 # -----------------------------
 
 from flask import Blueprint, request, jsonify, session  # Flask tools
-from db import get_db_connection  # Function to connect to PostgreSQL
+from db import db_connection  # Pooled PostgreSQL connections
+from utils.current_user import current_user, remember_profile  # Session-cached profile
+from utils.spatial_index import spatial_index  # In-memory farmer/product locations
 from datetime import datetime      # For timestamps (if needed)
 
 # -----------------------------
@@ -56,34 +58,36 @@ def signup_api():
     latitude, longitude = location_coords.get(location, (None, None))
 
     # -----------------------------
-    # Connect to database
+    # Borrow a pooled connection
     # -----------------------------
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
 
-    # -----------------------------
-    # Check if email already exists
-    # -----------------------------
-    cur.execute("SELECT id FROM users WHERE email = %s", (email,))
-    if cur.fetchone():
-        cur.close()
-        conn.close()
-        return jsonify({"status": "error", "message": "Email already exists"}), 400
+        # -----------------------------
+        # Check if email already exists
+        # -----------------------------
+        cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+        if cur.fetchone():
+            cur.close()
+            return jsonify({"status": "error", "message": "Email already exists"}), 400
 
-    # -----------------------------
-    # Insert user into database
-    # -----------------------------
-    cur.execute("""
-        INSERT INTO users (fullname, email, password_hash, location, user_type, latitude, longitude)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        RETURNING id
-    """, (fullname, email, password, location, user_type, latitude, longitude))
+        # -----------------------------
+        # Insert user into database
+        # -----------------------------
+        cur.execute("""
+            INSERT INTO users (fullname, email, password_hash, location, user_type, latitude, longitude)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (fullname, email, password, location, user_type, latitude, longitude))
 
-    user_id = cur.fetchone()[0]  # Get the newly inserted user's ID
+        user_id = cur.fetchone()[0]  # Get the newly inserted user's ID
 
-    conn.commit()   # Save changes
-    cur.close()
-    conn.close()    # Close connection
+        conn.commit()   # Save changes
+        cur.close()
+
+    # New farmers become visible to nearby searches right away
+    if user_type == "farmer":
+        spatial_index.set_farmer(user_id, latitude, longitude)
 
     # -----------------------------
     # Return response
@@ -106,30 +110,28 @@ def login_api():
     email = data.get('email')
     password = data.get('password')
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     # -----------------------------
     # Fetch user from DB
     # -----------------------------
-    cur.execute(
-        "SELECT id, password_hash, user_type, fullname FROM users WHERE email=%s",
-        (email,)
-    )
-    user = cur.fetchone()
-    if not user:
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, password_hash, user_type, fullname, email, location, latitude, longitude"
+            " FROM users WHERE email=%s",
+            (email,)
+        )
+        user = cur.fetchone()
         cur.close()
-        conn.close()
+
+    if not user:
         return {"status": "error", "message": "Email not found"}, 404
 
-    user_id, db_password, user_type, fullname = user
+    user_id, db_password, user_type, fullname, email, location, latitude, longitude = user
 
     # -----------------------------
     # Check password
     # -----------------------------
     if password != db_password:  # For production, replace with hashed password check
-        cur.close()
-        conn.close()
         return {"status": "error", "message": "Incorrect password"}, 401
 
     # -----------------------------
@@ -137,9 +139,11 @@ def login_api():
     # -----------------------------
     session['user_id'] = user_id       # Track logged-in user
     session['user_type'] = user_type   # Track role (farmer/consumer/admin)
-
-    cur.close()
-    conn.close()
+    # Profile rides along in the session so /auth/me and /farmer/me need no query
+    remember_profile({
+        "id": user_id, "fullname": fullname, "email": email, "user_type": user_type,
+        "location": location, "latitude": latitude, "longitude": longitude
+    })
 
     # -----------------------------
     # Return login success
@@ -188,32 +192,17 @@ def me_api():
     Returns the current logged-in user
     Can be used by frontend to check if user is authenticated
     """
-    if 'user_id' not in session:
-        return {"authenticated": False}, 401
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        "SELECT id, fullname, email, user_type, location, latitude, longitude FROM users WHERE id=%s",
-        (session['user_id'],)
-    )
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
-
+    user = current_user()   # from the session, no DB round trip
     if not user:
         return {"authenticated": False}, 401
 
-    user_id, fullname, email, user_type, location, latitude, longitude = user
-
     return {
         "authenticated": True,
-        "user_id": user_id,
-        "fullname": fullname,
-        "email": email,
-        "user_type": user_type,
-        "location": location,
-        "latitude": latitude,
-        "longitude": longitude
+        "user_id": user["id"],
+        "fullname": user["fullname"],
+        "email": user["email"],
+        "user_type": user["user_type"],
+        "location": user["location"],
+        "latitude": user["latitude"],
+        "longitude": user["longitude"]
     }
@@ -1,17 +1,25 @@
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify, session
+from sqlalchemy import bindparam, insert
 from extensions import db
 from models_cart import CartItem
 from models_farmer_items import FarmerItem
 from models_user import User
 from models_notification import Notification
+from models_order import Order, OrderItem
+from utils.catalog_cache import bump_catalog_version
+from utils.notify_bus import notification_bus
+from utils.recommenders import clear_distance_recommendations, mark_returning_customer
+from utils.reservations import available_to_sell, held_quantities, place_holds, release_holds
+from utils.sales_rollup import record_sales
 
 cart_bp = Blueprint("cart", __name__)
 
 DELIVERY_PER_FARMER = 50
 
-# Helper: get full cart for consumer
-def get_cart_for_consumer(consumer_id):
-    items = (
+def _cart_query():
+    return (
         db.session.query(
             CartItem.id.label("cart_id"),
             CartItem.product_id,
@@ -21,27 +29,71 @@ def get_cart_for_consumer(consumer_id):
             FarmerItem.available_stock,
             FarmerItem.min_order_qty,
             FarmerItem.photo_path,
+            FarmerItem.thumb_path,
             User.fullname.label("farmer_name"),
         )
         .join(FarmerItem, CartItem.product_id == FarmerItem.id)
         .join(User, FarmerItem.farmer_id == User.id)
+    )
+
+def _cart_line(i):
+    return {
+        "id": i.cart_id,
+        "product_id": i.product_id,
+        "item_name": i.item_name,
+        "farmer_name": i.farmer_name or "Unknown",
+        "price": float(i.price),
+        "available_stock": i.available_stock,
+        "min_order_qty": i.min_order_qty,
+        "quantity": i.quantity,
+        "photo_path": i.photo_path,
+        "thumb_path": i.thumb_path,
+    }
+
+# Helper: get full cart for consumer
+def get_cart_for_consumer(consumer_id):
+    items = _cart_query().filter(CartItem.consumer_id == consumer_id).all()
+    return [_cart_line(i) for i in items]
+
+# Helper: get only the given cart lines
+def get_cart_lines(consumer_id, cart_ids):
+    if not cart_ids:
+        return []
+    items = _cart_query().filter(CartItem.consumer_id == consumer_id, CartItem.id.in_(cart_ids)).all()
+    return [_cart_line(i) for i in items]
+
+# Helper: totals for the whole cart in one aggregate query (no per-line rows)
+def get_cart_summary(consumer_id):
+    line_count, total_quantity, subtotal, farmer_count = (
+        db.session.query(
+            db.func.count(CartItem.id),
+            db.func.coalesce(db.func.sum(CartItem.quantity), 0),
+            db.func.coalesce(db.func.sum(CartItem.quantity * FarmerItem.price), 0),
+            db.func.count(db.distinct(FarmerItem.farmer_id)),
+        )
+        .join(FarmerItem, CartItem.product_id == FarmerItem.id)
         .filter(CartItem.consumer_id == consumer_id)
-        .all()
+        .one()
     )
-    return [
-        {
-            "id": i.cart_id,
-            "product_id": i.product_id,
-            "item_name": i.item_name,
-            "farmer_name": i.farmer_name or "Unknown",
-            "price": float(i.price),
-            "available_stock": i.available_stock,
-            "min_order_qty": i.min_order_qty,
-            "quantity": i.quantity,
-            "photo_path": i.photo_path,
-        }
-        for i in items
-    ]
+    delivery = farmer_count * DELIVERY_PER_FARMER
+    return {
+        "line_count": line_count,
+        "total_quantity": int(total_quantity),
+        "subtotal": float(subtotal),
+        "delivery": delivery,
+        "total": float(subtotal) + delivery,
+    }
+
+# Helper: mutation response, full cart or only what changed (?delta=1)
+def cart_response(consumer_id, changed_ids=(), removed_ids=()):
+    if request.args.get("delta") not in ("1", "true"):
+        return jsonify({"status": "success", "cart": get_cart_for_consumer(consumer_id)})
+    return jsonify({
+        "status": "success",
+        "changed": get_cart_lines(consumer_id, list(changed_ids)),
+        "removed": list(removed_ids),
+        "summary": get_cart_summary(consumer_id),
+    })
 
 # -----------------------------
 # GET cart items
@@ -71,32 +123,37 @@ def add_to_cart():
     if not product_id:
         return jsonify({"status": "error", "message": "Product ID is required"}), 400
 
-    product = FarmerItem.query.get(product_id)
+    # Row lock so two carts can't both reserve the last units
+    product = FarmerItem.query.filter_by(id=product_id).with_for_update().first()
     if not product:
         return jsonify({"status": "error", "message": "Product not found"}), 404
 
-    if quantity < product.min_order_qty or quantity > product.available_stock:
+    # Stock minus what other carts currently hold
+    available = available_to_sell(product, consumer_id)
+    if quantity < product.min_order_qty or quantity > available:
+        db.session.rollback()
         return jsonify({
             "status": "error",
-            "message": f"Quantity must be between {product.min_order_qty} and {product.available_stock}"
+            "message": f"Quantity must be between {product.min_order_qty} and {available}"
         }), 400
 
     item = CartItem.query.filter_by(consumer_id=consumer_id, product_id=product_id).first()
     if item:
         new_qty = item.quantity + quantity
-        if new_qty > product.available_stock:
+        if new_qty > available:
+            db.session.rollback()
             return jsonify({
                 "status": "error",
-                "message": f"Cannot exceed available stock ({product.available_stock})"
+                "message": f"Cannot exceed available stock ({available})"
             }), 400
         item.quantity = new_qty
     else:
         item = CartItem(consumer_id=consumer_id, product_id=product_id, quantity=quantity)
         db.session.add(item)
 
+    place_holds(consumer_id, {product_id: item.quantity})
     db.session.commit()
-    cart_data = get_cart_for_consumer(consumer_id)
-    return jsonify({"status": "success", "cart": cart_data})
+    return cart_response(consumer_id, changed_ids=[item.id])
 
 # -----------------------------
 # UPDATE quantity
@@ -115,18 +172,20 @@ def update_cart_item(item_id):
     if not item or item.consumer_id != session["user_id"]:
         return jsonify({"status": "error", "message": "Item not found"}), 404
 
-    product = FarmerItem.query.get(item.product_id)
-    if quantity < product.min_order_qty or quantity > product.available_stock:
+    product = FarmerItem.query.filter_by(id=item.product_id).with_for_update().first()
+    available = available_to_sell(product, item.consumer_id)
+    if quantity < product.min_order_qty or quantity > available:
+        db.session.rollback()
         return jsonify({
             "status": "error",
-            "message": f"Quantity must be between {product.min_order_qty} and {product.available_stock}"
+            "message": f"Quantity must be between {product.min_order_qty} and {available}"
         }), 400
 
     item.quantity = quantity
+    place_holds(item.consumer_id, {item.product_id: quantity})
     db.session.commit()
 
-    cart_data = get_cart_for_consumer(item.consumer_id)
-    return jsonify({"status": "success", "cart": cart_data})
+    return cart_response(item.consumer_id, changed_ids=[item_id])
 
 # -----------------------------
 # REMOVE item
@@ -140,17 +199,108 @@ def remove_cart_item(item_id):
     if not item or item.consumer_id != session["user_id"]:
         return jsonify({"status": "error", "message": "Item not found"}), 404
 
+    release_holds(item.consumer_id, [item.product_id])
     db.session.delete(item)
     db.session.commit()
 
-    cart_data = get_cart_for_consumer(session["user_id"])
-    return jsonify({"status": "success", "cart": cart_data})
+    return cart_response(session["user_id"], removed_ids=[item_id])
+
+# -----------------------------
+# BATCH update quantities
+# -----------------------------
+@cart_bp.route("/batch", methods=["PUT"])
+def batch_update_cart():
+    """
+    Apply many quantity changes in one transaction.
+    Body: {"items": [{"id": <cart item id>, "quantity": <n>}, ...]}, quantity 0 removes the line.
+    Stock is validated for every line with a single query; if any line fails
+    nothing is written and the per-line errors are returned.
+    Always answers in delta form (changed lines, removed ids, summary).
+    """
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    consumer_id = session["user_id"]
+    data = request.get_json() or {}
+    changes = {}
+    for change in data.get("items", []):
+        if not isinstance(change.get("id"), int) or not isinstance(change.get("quantity"), int):
+            return jsonify({"status": "error", "message": "Each item needs an integer id and quantity"}), 400
+        changes[change["id"]] = change["quantity"]
+    if not changes:
+        return jsonify({"status": "error", "message": "No items given"}), 400
+
+    # One query: the consumer's affected cart lines with their product limits
+    # (product rows locked so concurrent carts can't over-reserve, in id
+    # order like checkout, so overlapping writers can't deadlock)
+    rows = (
+        db.session.query(CartItem, FarmerItem.min_order_qty, FarmerItem.available_stock)
+        .join(FarmerItem, CartItem.product_id == FarmerItem.id)
+        .filter(CartItem.consumer_id == consumer_id, CartItem.id.in_(list(changes)))
+        .order_by(FarmerItem.id)
+        .with_for_update(of=FarmerItem)
+        .all()
+    )
+    # One more: what other carts hold on those products
+    held = held_quantities({item.product_id for item, _, _ in rows}, exclude_consumer=consumer_id)
+    found = {
+        item.id: (item, min_qty, stock - held.get(item.product_id, 0))
+        for item, min_qty, stock in rows
+    }
+
+    errors = []
+    for item_id, quantity in changes.items():
+        if item_id not in found:
+            errors.append({"id": item_id, "message": "Item not found"})
+            continue
+        _, min_qty, stock = found[item_id]
+        if quantity != 0 and (quantity < min_qty or quantity > stock):
+            errors.append({"id": item_id, "message": f"Quantity must be between {min_qty} and {stock}"})
+    if errors:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": "Some items could not be updated", "errors": errors}), 400
+
+    changed, removed, holds, released = [], [], {}, []
+    for item_id, quantity in changes.items():
+        item = found[item_id][0]
+        if quantity == 0:
+            db.session.delete(item)
+            removed.append(item_id)
+            released.append(item.product_id)
+        else:
+            item.quantity = quantity
+            changed.append(item_id)
+            holds[item.product_id] = quantity
+    place_holds(consumer_id, holds)
+    release_holds(consumer_id, released)
+    db.session.commit()
+
+    return jsonify({
+        "status": "success",
+        "changed": get_cart_lines(consumer_id, changed),
+        "removed": removed,
+        "summary": get_cart_summary(consumer_id),
+    })
+
+# Helper: "Tomato (Only 2 in stock (minimum order 1)), ..." for checkout messages
+def describe_failed(failed):
+    return ", ".join(f"{f.get('item_name', 'cart item ' + str(f['id']))} ({f['message']})" for f in failed)
 
 # -----------------------------
 # CHECKOUT
 # -----------------------------
 @cart_bp.route("/checkout", methods=["POST"])
 def checkout():
+    """
+    Place orders for the selected cart lines in one transaction:
+    1. Lock the affected farmer_items rows in id order (no deadlocks between
+       concurrent checkouts, no overselling)
+    2. Decrement stock for every line that still fits
+    3. Insert one order per farmer, their order_items and all notifications
+       with one multi-row INSERT each
+    4. Add the lines to the daily sales rollups
+    Lines that can't be fulfilled are reported in "failed" and stay in the cart.
+    """
     if "user_id" not in session:
         return jsonify({"status": "error", "message": "Not logged in"}), 401
 
@@ -161,55 +311,146 @@ def checkout():
     if not item_ids:
         return jsonify({"status": "error", "message": "No items selected"}), 400
 
-    items = (
-        db.session.query(
-            CartItem.id,
-            CartItem.quantity,
-            FarmerItem.item_name,
-            FarmerItem.price,
-            User.fullname.label("farmer_name"),
-            User.id.label("farmer_id")
-        )
-        .join(FarmerItem, CartItem.product_id == FarmerItem.id)
-        .join(User, FarmerItem.farmer_id == User.id)
+    cart_items = (
+        CartItem.query
         .filter(CartItem.consumer_id == consumer_id, CartItem.id.in_(item_ids))
+        .order_by(CartItem.id)
         .all()
     )
-
-    if not items:
+    if not cart_items:
         return jsonify({"status": "error", "message": "No items found"}), 400
 
-    order_summary = []
-    for i in items:
-        order_summary.append({
-            "item_name": i.item_name,
-            "quantity": i.quantity,
-            "price": float(i.price),
-            "farmer_name": i.farmer_name
-        })
-
-        # Notify farmer
-        note = Notification(
-            user_id=i.farmer_id,
-            message=f"{i.quantity} kg of {i.item_name} has been ordered by a consumer."
-        )
-        db.session.add(note)
+    # SELECT ... FOR UPDATE in a fixed order; concurrent checkouts queue here
+    products = {
+        p.id: p
+        for p in FarmerItem.query
+        .filter(FarmerItem.id.in_({c.product_id for c in cart_items}))
+        .order_by(FarmerItem.id)
+        .with_for_update()
+        .all()
+    }
+    # Other consumers' live holds count against what this checkout may take
+    held = held_quantities(products, exclude_consumer=consumer_id)
+    farmer_names = dict(
+        db.session.query(User.id, User.fullname)
+        .filter(User.id.in_({p.farmer_id for p in products.values()}))
+        .all()
+    )
 
-    # Delete only the ordered cart items
-    CartItem.query.filter(CartItem.consumer_id == consumer_id, CartItem.id.in_(item_ids)).delete(synchronize_session=False)
-
-    # -----------------------------
-    # Notify consumer with itemized message
-    details = ", ".join([f"{i.quantity} kg of {i.item_name} - Rs {i.quantity * i.price}" for i in items])
-    consumer_note = Notification(
-        user_id=consumer_id,
-        message=f"Your order has been placed successfully: {details}"
+    placed, failed, decrements = [], [], {}
+    for c in cart_items:
+        product = products.get(c.product_id)
+        if product is None:
+            failed.append({"id": c.id, "message": "Product no longer available"})
+            continue
+        remaining = product.available_stock - held.get(product.id, 0) - decrements.get(product.id, 0)
+        if c.quantity < product.min_order_qty or c.quantity > remaining:
+            failed.append({
+                "id": c.id,
+                "item_name": product.item_name,
+                "message": f"Only {remaining} in stock (minimum order {product.min_order_qty})"
+            })
+            continue
+        decrements[product.id] = decrements.get(product.id, 0) + c.quantity
+        placed.append((c, product))
+
+    if not placed:
+        db.session.rollback()
+        return jsonify({
+            "status": "error",
+            "message": f"None of the selected items could be ordered: {describe_failed(failed)}",
+            "failed": failed
+        }), 409
+
+    # Stock: one executemany UPDATE, relative to the locked value
+    db.session.execute(
+        FarmerItem.__table__.update()
+        .where(FarmerItem.__table__.c.id == bindparam("pid"))
+        .values(available_stock=FarmerItem.__table__.c.available_stock - bindparam("qty")),
+        [{"pid": pid, "qty": qty} for pid, qty in decrements.items()]
     )
-    db.session.add(consumer_note)
+
+    # Orders: one per farmer, inserted together; ids come back in parameter order
+    by_farmer = {}
+    for c, product in placed:
+        by_farmer.setdefault(product.farmer_id, []).append((c, product))
+    farmer_ids = list(by_farmer)
+    now = datetime.utcnow()   # one timestamp, so the rollup day matches orders.created_at
+    order_ids = db.session.execute(
+        insert(Order).returning(Order.id, sort_by_parameter_order=True),
+        [
+            {
+                "consumer_id": consumer_id,
+                "total_amount": sum(c.quantity * p.price for c, p in by_farmer[fid]),
+                "status": "Pending",
+                "created_at": now,
+            }
+            for fid in farmer_ids
+        ]
+    ).scalars().all()
+    order_for_farmer = dict(zip(farmer_ids, order_ids))
+
+    db.session.execute(insert(OrderItem), [
+        {
+            "order_id": order_for_farmer[p.farmer_id],
+            "product_id": p.id,
+            "farmer_id": p.farmer_id,
+            "quantity": c.quantity,
+            "price": p.price,
+        }
+        for c, p in placed
+    ])
+    record_sales([
+        (order_for_farmer[p.farmer_id], p.farmer_id, p.id, c.quantity, p.price)
+        for c, p in placed
+    ], now.date())
+
+    # Notify each farmer per line, and the consumer once with an itemized message
+    details = ", ".join([f"{c.quantity} kg of {p.item_name} - Rs {c.quantity * p.price}" for c, p in placed])
+    notes = [
+        {"user_id": p.farmer_id, "message": f"{c.quantity} kg of {p.item_name} has been ordered by a consumer."}
+        for c, p in placed
+    ]
+    notes.append({"user_id": consumer_id, "message": f"Your order has been placed successfully: {details}"})
+    inserted = db.session.execute(
+        insert(Notification).returning(
+            Notification.id, Notification.user_id, Notification.message, Notification.created_at
+        ),
+        notes
+    ).all()
+    notification_bus.publish(db.session, inserted)   # pushed to SSE clients on commit
+
+    # Holds become real stock decrements
+    release_holds(consumer_id, decrements)
+
+    # Built before commit: committing expires the ORM objects
+    order_summary = [
+        {
+            "item_name": p.item_name,
+            "quantity": c.quantity,
+            "price": float(p.price),
+            "farmer_name": farmer_names.get(p.farmer_id)
+        }
+        for c, p in placed
+    ]
+
+    # Delete only the ordered cart items
+    CartItem.query.filter(
+        CartItem.consumer_id == consumer_id,
+        CartItem.id.in_([c.id for c, _ in placed])
+    ).delete(synchronize_session=False)
+
+    clear_distance_recommendations(consumer_id)   # now a returning customer
+
     db.session.commit()
+    bump_catalog_version()   # available_stock changed
+    mark_returning_customer(consumer_id)
 
     return jsonify({
-        "status": "success",
-        "message": "Your order has been placed successfully",
-        "order_details": order_summary
+        "status": "success" if not failed else "partial",
+        "message": "Your order has been placed successfully" if not failed else
+                   f"Part of your order was placed; still in your cart: {describe_failed(failed)}",
+        "order_ids": order_ids,
+        "order_details": order_summary,
+        "failed": failed
     })
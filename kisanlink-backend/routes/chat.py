@@ -1,22 +1,254 @@
 # routes/chat.py
-from flask import Blueprint, request, jsonify
+import queue
+from datetime import datetime
+
+import click
+from flask import Blueprint, request, jsonify, session
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from extensions import db
+from models_chat import ChatThread, Message, conversation_key
+from utils.notify_bus import NotificationBus
 
 # ✅ Define blueprint first
 chat_bp = Blueprint("chat", __name__)
 
-# Example: fetch messages for a consumer
-@chat_bp.route("/messages/<int:consumer_id>", methods=["GET"])
-def get_messages(consumer_id):
-    # Example static messages
-    messages = [
-        {"from": "Farmer A", "message": "Your order is ready."},
-        {"from": "Farmer B", "message": "New product available."}
-    ]
-    return jsonify(messages), 200
-
-# Example: send a message
+
+def message_to_dict(m):
+    return {
+        "id": m.id,
+        "user_id": m.receiver_id,   # routing key for chat_bus
+        "sender_id": m.sender_id,
+        "receiver_id": m.receiver_id,
+        "content": m.content,
+        "timestamp": m.timestamp.isoformat()
+    }
+
+
+# Wakes up long-polling receivers when a message is committed
+chat_bus = NotificationBus(
+    backend=Config.NOTIFY_BACKEND,
+    channel=Config.CHAT_CHANNEL,
+    queue_size=Config.SSE_QUEUE_SIZE,
+    serializer=message_to_dict,
+)
+
+
+# Conversation list: one indexed query on the denormalized threads
+@chat_bp.route("/conversations", methods=["GET"])
+def get_conversations():
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    threads = (
+        ChatThread.query
+        .filter_by(user_id=session["user_id"])
+        .order_by(ChatThread.last_at.desc())
+        .all()
+    )
+    return jsonify({
+        "status": "success",
+        "conversations": [
+            {
+                "peer_id": t.peer_id,
+                "last_message": t.last_message,
+                "last_at": t.last_at.isoformat() if t.last_at else None,
+                "unread_count": t.unread_count
+            } for t in threads
+        ]
+    }), 200
+
+
+# History with one user, newest first: ?limit=N&cursor=<next_cursor>
+@chat_bp.route("/messages/<int:peer_id>", methods=["GET"])
+def get_messages(peer_id):
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    user_id = session["user_id"]
+    limit = min(request.args.get("limit", Config.CHAT_PAGE_SIZE, type=int), Config.CHAT_PAGE_SIZE * 4)
+    query = Message.query.filter_by(conversation=conversation_key(user_id, peer_id))
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            ts, _, msg_id = cursor.rpartition("_")
+            ts, msg_id = datetime.fromisoformat(ts), int(msg_id)
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid cursor"}), 400
+        # Keyset seek on (timestamp, id), served by ix_messages_conversation_timestamp
+        query = query.filter(db.or_(
+            Message.timestamp < ts,
+            db.and_(Message.timestamp == ts, Message.id < msg_id)
+        ))
+    else:
+        # Opening the conversation reads it
+        ChatThread.query.filter_by(user_id=user_id, peer_id=peer_id).update(
+            {ChatThread.unread_count: 0}, synchronize_session=False
+        )
+        db.session.commit()
+
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    return jsonify({
+        "status": "success",
+        "messages": [message_to_dict(m) for m in messages],
+        "next_cursor": f"{messages[-1].timestamp.isoformat()}_{messages[-1].id}" if has_more else None
+    }), 200
+
+
+def _threads_between(user_a, user_b):
+    return {
+        (t.user_id, t.peer_id): t
+        for t in ChatThread.query.filter(db.or_(
+            db.and_(ChatThread.user_id == user_a, ChatThread.peer_id == user_b),
+            db.and_(ChatThread.user_id == user_b, ChatThread.peer_id == user_a)
+        ))
+    }
+
+
+# Send a message
 @chat_bp.route("/messages", methods=["POST"])
 def send_message():
-    data = request.json
-    # Here you can save to database later
-    return jsonify({"status": "Message sent", "data": data}), 201
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    data = request.json or {}
+    sender_id = session["user_id"]
+    receiver_id = data.get("receiver_id")
+    content = (data.get("content") or "").strip()
+    if not isinstance(receiver_id, int) or not content or receiver_id == sender_id:
+        return jsonify({"status": "error", "message": "receiver_id and content are required"}), 400
+
+    message = Message(
+        conversation=conversation_key(sender_id, receiver_id),
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        content=content
+    )
+    db.session.add(message)
+    db.session.flush()
+
+    # Keep both sides' thread rows current (one read, then in-place updates)
+    pairs = ((sender_id, receiver_id), (receiver_id, sender_id))
+    threads = _threads_between(sender_id, receiver_id)
+    missing = [pair for pair in pairs if pair not in threads]
+    if missing:
+        # First message between the two: a concurrent one may create the rows too.
+        # One savepoint per row keeps the message (and the other row) when the
+        # unique constraint says it did.
+        for user_id, peer_id in missing:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(ChatThread(user_id=user_id, peer_id=peer_id, unread_count=0))
+            except IntegrityError:
+                pass
+        threads = _threads_between(sender_id, receiver_id)
+
+    for user_id, peer_id in pairs:
+        thread = threads[(user_id, peer_id)]
+        thread.last_message_id = message.id
+        thread.last_message = content[:200]
+        thread.last_at = message.timestamp
+        if user_id == receiver_id:
+            thread.unread_count = ChatThread.unread_count + 1
+
+    chat_bus.publish(db.session, [message])   # wakes the receiver's long-poll on commit
+    result = message_to_dict(message)
+    db.session.commit()
+
+    return jsonify({"status": "Message sent", "data": result}), 201
+
+
+# Long-poll: returns as soon as a message newer than ?after=<id> arrives, or empty after CHAT_POLL_TIMEOUT.
+# Without ?after only messages arriving from now on count (history comes from /messages/<peer_id>).
+@chat_bp.route("/poll", methods=["GET"])
+def poll_messages():
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    user_id = session["user_id"]
+    after = request.args.get("after", type=int)
+    if after is None:
+        after = (
+            db.session.query(db.func.max(Message.id))
+            .filter(Message.receiver_id == user_id)
+            .scalar()
+        ) or 0
+
+    # Subscribe before checking the DB so a message committed in between isn't missed
+    sub = chat_bus.subscribe(user_id)
+    try:
+        missed = (
+            Message.query
+            .filter(Message.receiver_id == user_id, Message.id > after)
+            .order_by(Message.id)
+            .limit(Config.CHAT_PAGE_SIZE)
+            .all()
+        )
+        if missed:
+            return jsonify({"status": "success", "messages": [message_to_dict(m) for m in missed]}), 200
+
+        db.session.remove()   # don't hold a connection while waiting
+        rows = []
+        try:
+            rows.append(sub.queue.get(timeout=Config.CHAT_POLL_TIMEOUT))
+            while True:
+                rows.append(sub.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return jsonify({"status": "success", "messages": [r for r in rows if r["id"] > after]}), 200
+    finally:
+        chat_bus.unsubscribe(sub)
+
+
+# -----------------------------
+# Migration for databases created before conversations/threads
+# -----------------------------
+@chat_bp.cli.command("migrate")
+def migrate_chat():
+    """
+    Bring an existing messages table up to date (safe to re-run):
+      ALTER TABLE messages ADD COLUMN conversation varchar(50);
+      UPDATE messages SET conversation = <low id>:<high id>;
+      ALTER TABLE messages ALTER COLUMN conversation SET NOT NULL;   (Postgres)
+    then create the new indexes and chat_threads, and fill chat_threads
+    from the newest message of every (user, peer) pair.
+    """
+    engine = db.engine
+    columns = {c["name"] for c in inspect(engine).get_columns("messages")}
+    with engine.begin() as conn:
+        if "conversation" not in columns:
+            conn.execute(text("ALTER TABLE messages ADD COLUMN conversation VARCHAR(50)"))
+        updated = conn.execute(text("""
+            UPDATE messages
+            SET conversation = CASE WHEN sender_id < receiver_id
+                                    THEN sender_id || ':' || receiver_id
+                                    ELSE receiver_id || ':' || sender_id END
+            WHERE conversation IS NULL
+        """)).rowcount
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE messages ALTER COLUMN conversation SET NOT NULL"))
+    for index in Message.__table__.indexes:
+        index.create(engine, checkfirst=True)
+    ChatThread.__table__.create(engine, checkfirst=True)
+
+    with engine.begin() as conn:
+        threads = conn.execute(text("""
+            INSERT INTO chat_threads (user_id, peer_id, last_message_id, last_message, last_at, unread_count)
+            SELECT pairs.user_id, pairs.peer_id, m.id, SUBSTR(m.content, 1, 200), m.timestamp, 0
+            FROM (
+                SELECT user_id, peer_id, MAX(id) AS last_id
+                FROM (SELECT sender_id AS user_id, receiver_id AS peer_id, id FROM messages
+                      UNION ALL
+                      SELECT receiver_id, sender_id, id FROM messages) both_sides
+                GROUP BY user_id, peer_id
+            ) pairs
+            JOIN messages m ON m.id = pairs.last_id
+            WHERE NOT EXISTS (SELECT 1 FROM chat_threads t
+                              WHERE t.user_id = pairs.user_id AND t.peer_id = pairs.peer_id)
+        """)).rowcount
+    click.echo(f"messages given a conversation: {updated}, threads created: {threads}")
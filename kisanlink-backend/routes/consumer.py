@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import bindparam, text
 from extensions import db
-from utils.distance import haversine
+from utils.catalog_cache import catalog_cached
+from utils.spatial_index import spatial_index
 
 consumer_bp = Blueprint("consumer", __name__)
 
 @consumer_bp.route('/nearby-products', methods=['GET'])
+@catalog_cached()
 def nearby_products():
     # 1. Get consumer location from frontend
     try:
@@ -13,23 +16,40 @@ def nearby_products():
     except:
         return jsonify({"error": "Invalid coordinates"}), 400
 
-    # 2. Fetch all farmer_items + farmer location
-    query = """
-        SELECT fi.*, u.fullname AS farmer_name, u.latitude AS farmer_lat, u.longitude AS farmer_lon
+    # Optional: only products within radius_km, and at most `limit` of them
+    radius_km = request.args.get("radius_km", type=float)
+    limit = request.args.get("limit", type=int)
+    if (radius_km is not None and radius_km <= 0) or (limit is not None and limit <= 0):
+        return jsonify({"error": "radius_km and limit must be positive"}), 400
+
+    # 2. Ask the spatial index which products are nearest (no table scan)
+    spatial_index.ensure_fresh()
+    ranked = spatial_index.nearby_products(consumer_lat, consumer_lon, radius_km=radius_km, limit=limit)
+    if not ranked:
+        return jsonify([])
+
+    # 3. Fetch just those products + farmer name
+    query = text("""
+        SELECT fi.id, fi.item_name, fi.price, fi.photo_path, fi.thumb_path, fi.location,
+               fi.min_order_qty, fi.available_stock, u.fullname AS farmer_name
         FROM farmer_items fi
         JOIN users u ON fi.farmer_id = u.id
-    """
-    result = db.session.execute(query)
+        WHERE fi.id IN :ids
+    """).bindparams(bindparam("ids", expanding=True))
+    rows = {r.id: r for r in db.session.execute(query, {"ids": [pid for pid, _ in ranked]})}
 
-    # 3. Calculate distance for each product
+    # 4. Serialize in distance order (rows deleted since the index saw them are skipped)
     items = []
-    for row in result:
-        distance_km = haversine(consumer_lat, consumer_lon, row.farmer_lat, row.farmer_lon)
+    for product_id, distance_km in ranked:
+        row = rows.get(product_id)
+        if row is None:
+            continue
         items.append({
             "id": row.id,
             "item_name": row.item_name,
             "price": row.price,
             "photo_path": row.photo_path,
+            "thumb_path": row.thumb_path,
             "location": row.location,
             "min_order_qty": row.min_order_qty,
             "available_stock": row.available_stock,
@@ -37,6 +57,4 @@ def nearby_products():
             "distance": round(distance_km, 2)  # km
         })
 
-    # 4. Sort by distance ascending
-    items.sort(key=lambda x: x["distance"])
     return jsonify(items)
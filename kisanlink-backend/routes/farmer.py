@@ -1,19 +1,17 @@
 import os
-from flask import Blueprint, request, jsonify, send_from_directory, session
-from werkzeug.utils import secure_filename
-from db import get_db_connection
+from flask import Blueprint, request, jsonify, session
+from config import Config
+from db import db_connection
+from utils.catalog_cache import bump_catalog_version, catalog_cached
+from utils.current_user import current_user
+from utils.images import InvalidImage, build_variants, file_digest, image_jobs, ingest_upload, ready_variants
+from utils.spatial_index import spatial_index
 
 # Create a Flask blueprint for farmer-related routes
 farmer_bp = Blueprint("farmer", __name__)
 
-# Directory where uploaded product images will be stored
-UPLOAD_FOLDER = "uploads"
 # Allowed file extensions for uploaded images
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
-
-# Create the uploads folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 
 # Mapping human-readable location names to latitude/longitude
 location_coords = {
@@ -27,11 +25,6 @@ location_coords = {
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Serve uploaded images from the server
-@farmer_bp.route("/uploads/<filename>")
-def uploaded_file(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
-
 # ------------------ Farmer Info ------------------
 @farmer_bp.route("/me", methods=["GET"])
 def get_farmer_info():
@@ -43,30 +36,19 @@ def get_farmer_info():
         if not farmer_id:
             return jsonify({"error": "Not logged in"}), 401
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Fetch farmer details from users table
-        cur.execute("""
-            SELECT id, fullname, email, location, latitude, longitude, user_type
-            FROM users
-            WHERE id=%s
-        """, (farmer_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-
-        if not row:
+        # Profile cached in the session at login; no DB round trip
+        user = current_user()
+        if not user:
             return jsonify({"error": "Farmer not found"}), 404
 
-        # Convert row to dict
         farmer = {
-            "id": row[0],
-            "fullname": row[1],
-            "email": row[2],
-            "location": row[3],
-            "latitude": row[4],
-            "longitude": row[5],
-            "user_type": row[6]
+            "id": user["id"],
+            "fullname": user["fullname"],
+            "email": user["email"],
+            "location": user["location"],
+            "latitude": user["latitude"],
+            "longitude": user["longitude"],
+            "user_type": user["user_type"]
         }
 
         return jsonify(farmer), 200
@@ -102,24 +84,37 @@ def add_product():
         if not allowed_file(photo.filename):
             return jsonify({"error": "Invalid file type"}), 400
 
-        # Secure filename and save photo
-        filename = secure_filename(photo.filename)
-        photo.save(os.path.join(UPLOAD_FOLDER, filename))
+        # Store photo under its content hash; thumbnails are built in the background
+        try:
+            filename, digest = ingest_upload(photo)
+        except InvalidImage as e:
+            return jsonify({"error": str(e)}), 400
+        variants = ready_variants(digest) or {}
 
         # Get coordinates from location
         latitude, longitude = location_coords.get(location, (None, None))
 
         # Insert product into database
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO farmer_items
-            (farmer_id, item_name, price, photo_path, location, min_order_qty, available_stock, latitude, longitude)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (farmer_id, item_name, price, filename, location, min_order_qty, available_stock, latitude, longitude))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO farmer_items
+                (farmer_id, item_name, price, photo_path, thumb_path, medium_path,
+                 location, min_order_qty, available_stock, latitude, longitude)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (farmer_id, item_name, price, filename, variants.get("thumb_path"), variants.get("medium_path"),
+                  location, min_order_qty, available_stock, latitude, longitude))
+            product_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+
+        if not variants:
+            image_jobs.submit(filename, digest)   # row is committed, the worker can update it
+        # Nearby search uses the farmer's coordinates, not the product's
+        farmer = current_user() or {}
+        spatial_index.set_product(product_id, farmer_id, farmer.get("latitude"), farmer.get("longitude"))
+        bump_catalog_version()
 
         return jsonify({"message": "Product added successfully"}), 201
 
@@ -129,6 +124,7 @@ def add_product():
 
 # ------------------ Get Products ------------------
 @farmer_bp.route("/products", methods=["GET"])
+@catalog_cached(per_user=True)
 def get_products():
     """
     Get all products for the logged-in farmer
@@ -138,16 +134,16 @@ def get_products():
         if not farmer_id:
             return jsonify({"error": "Not logged in"}), 401
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, item_name, price, photo_path, location, min_order_qty, available_stock, latitude, longitude
-            FROM farmer_items
-            WHERE farmer_id=%s
-        """, (farmer_id,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, item_name, price, photo_path, location, min_order_qty, available_stock, latitude, longitude,
+                       thumb_path, medium_path
+                FROM farmer_items
+                WHERE farmer_id=%s
+            """, (farmer_id,))
+            rows = cur.fetchall()
+            cur.close()
 
         # Convert rows to list of dicts
         products = [
@@ -160,7 +156,9 @@ def get_products():
                 "min_order_qty": r[5],
                 "available_stock": r[6],
                 "latitude": r[7],
-                "longitude": r[8]
+                "longitude": r[8],
+                "thumb_path": r[9],
+                "medium_path": r[10]
             } for r in rows
         ]
 
@@ -180,45 +178,60 @@ def update_product(product_id):
         if not farmer_id:
             return jsonify({"error": "Not logged in"}), 401
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Fetch product to check ownership
-        cur.execute("SELECT farmer_id, photo_path FROM farmer_items WHERE id=%s", (product_id,))
-        product = cur.fetchone()
-        if not product:
-            return jsonify({"error": "Product not found"}), 404
-        if product[0] != farmer_id:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Get updated fields
-        item_name = request.form.get("item_name")
-        price = float(request.form.get("price"))
-        location = request.form.get("location")
-        min_order_qty = int(request.form.get("min_order_qty"))
-        available_stock = int(request.form.get("available_stock"))
-
-        old_photo = product[1]
-        photo = request.files.get("photo")
-        # Save new photo if uploaded, else keep old
-        if photo and allowed_file(photo.filename):
-            filename = secure_filename(photo.filename)
-            photo.save(os.path.join(UPLOAD_FOLDER, filename))
-            photo_to_save = filename
-        else:
-            photo_to_save = old_photo
-
-        latitude, longitude = location_coords.get(location, (None, None))
-
-        # Update product in database
-        cur.execute("""
-            UPDATE farmer_items
-            SET item_name=%s, price=%s, location=%s, min_order_qty=%s, available_stock=%s, photo_path=%s, latitude=%s, longitude=%s
-            WHERE id=%s
-        """, (item_name, price, location, min_order_qty, available_stock, photo_to_save, latitude, longitude, product_id))
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Fetch product to check ownership
+            cur.execute("""
+                SELECT fi.farmer_id, fi.photo_path, fi.thumb_path, fi.medium_path, u.latitude, u.longitude
+                FROM farmer_items fi
+                JOIN users u ON u.id = fi.farmer_id
+                WHERE fi.id=%s
+            """, (product_id,))
+            product = cur.fetchone()
+            if not product:
+                return jsonify({"error": "Product not found"}), 404
+            if product[0] != farmer_id:
+                return jsonify({"error": "Unauthorized"}), 403
+
+            # Get updated fields
+            item_name = request.form.get("item_name")
+            price = float(request.form.get("price"))
+            location = request.form.get("location")
+            min_order_qty = int(request.form.get("min_order_qty"))
+            available_stock = int(request.form.get("available_stock"))
+
+            photo = request.files.get("photo")
+            # Store new photo if uploaded, else keep old
+            digest = None
+            if photo and allowed_file(photo.filename):
+                try:
+                    photo_to_save, digest = ingest_upload(photo)
+                except InvalidImage as e:
+                    return jsonify({"error": str(e)}), 400
+                variants = ready_variants(digest) or {}
+            else:
+                photo_to_save = product[1]
+                variants = {"thumb_path": product[2], "medium_path": product[3]}
+
+            latitude, longitude = location_coords.get(location, (None, None))
+
+            # Update product in database
+            cur.execute("""
+                UPDATE farmer_items
+                SET item_name=%s, price=%s, location=%s, min_order_qty=%s, available_stock=%s,
+                    photo_path=%s, thumb_path=%s, medium_path=%s, latitude=%s, longitude=%s
+                WHERE id=%s
+            """, (item_name, price, location, min_order_qty, available_stock,
+                  photo_to_save, variants.get("thumb_path"), variants.get("medium_path"),
+                  latitude, longitude, product_id))
+
+            conn.commit()
+            cur.close()
+
+        if digest and not variants:
+            image_jobs.submit(photo_to_save, digest)
+        spatial_index.set_product(product_id, farmer_id, product[4], product[5])
+        bump_catalog_version()
 
         return jsonify({"message": "Product updated successfully"}), 200
 
@@ -237,23 +250,48 @@ def delete_product(product_id):
         if not farmer_id:
             return jsonify({"error": "Not logged in"}), 401
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Check ownership
-        cur.execute("SELECT farmer_id FROM farmer_items WHERE id=%s", (product_id,))
-        product = cur.fetchone()
-        if not product:
-            return jsonify({"error": "Product not found"}), 404
-        if product[0] != farmer_id:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Delete product
-        cur.execute("DELETE FROM farmer_items WHERE id=%s", (product_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Check ownership
+            cur.execute("SELECT farmer_id FROM farmer_items WHERE id=%s", (product_id,))
+            product = cur.fetchone()
+            if not product:
+                return jsonify({"error": "Product not found"}), 404
+            if product[0] != farmer_id:
+                return jsonify({"error": "Unauthorized"}), 403
+
+            # Delete product
+            cur.execute("DELETE FROM farmer_items WHERE id=%s", (product_id,))
+            conn.commit()
+            cur.close()
+
+        spatial_index.remove_product(product_id)
+        bump_catalog_version()
 
         return jsonify({"message": "Product deleted successfully"}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# ------------------ Photo variants for existing products (flask farmer build-thumbnails) ------------------
+@farmer_bp.cli.command("build-thumbnails")
+def build_thumbnails_command():
+    """Generate thumbnails/WebP variants for product photos that don't have them yet."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT photo_path FROM farmer_items WHERE photo_path IS NOT NULL AND thumb_path IS NULL")
+        photos = [row[0] for row in cur.fetchall()]
+        cur.close()
+
+    built = 0
+    for filename in photos:
+        path = os.path.join(Config.UPLOAD_FOLDER, filename)
+        if not os.path.exists(path):
+            print("Missing photo:", filename)
+            continue
+        try:
+            build_variants(filename, file_digest(path))
+            built += 1
+        except Exception as e:
+            print("Could not build variants for", filename, e)
+    print(f"Built variants for {built} of {len(photos)} photos")
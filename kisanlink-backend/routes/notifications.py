@@ -1,17 +1,228 @@
-from flask import Blueprint, jsonify, session
-from models_notification import Notification
+import json
+import queue
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, Response, jsonify, request, session
+from sqlalchemy import insert, select
+from config import Config
+from extensions import db
+from models_notification import Notification, NotificationArchive
+from utils.notify_bus import notification_bus, serialize
 
 notifications_bp = Blueprint("notifications", __name__)
 
+
+def encode_cursor(n):
+    return f"{n.created_at.isoformat()}_{n.id}"
+
+
+def decode_cursor(cursor):
+    created_at, _, note_id = cursor.rpartition("_")
+    return datetime.fromisoformat(created_at), int(note_id)
+
+
+def notification_to_dict(n):
+    return {
+        "id": n.id,
+        "message": n.message,
+        "is_read": bool(n.is_read),
+        "timestamp": n.created_at.isoformat()
+    }
+
+
 @notifications_bp.route("/", methods=["GET"])
 def get_notifications():
+    """
+    Newest first, one page at a time.
+    ?limit=N (default NOTIFICATIONS_PAGE_SIZE) and ?cursor=<next_cursor from the previous page>.
+    """
     if "user_id" not in session:
         return jsonify({"status": "error", "message": "Not logged in"}), 401
-    notifications = Notification.query.filter_by(user_id=session["user_id"]).all()
+
+    limit = min(request.args.get("limit", Config.NOTIFICATIONS_PAGE_SIZE, type=int),
+                Config.NOTIFICATIONS_MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({"status": "error", "message": "limit must be positive"}), 400
+
+    query = Notification.query.filter_by(user_id=session["user_id"])
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            created_at, note_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid cursor"}), 400
+        # Keyset seek on (created_at, id), served by ix_notifications_user_created
+        query = query.filter(db.or_(
+            Notification.created_at < created_at,
+            db.and_(Notification.created_at == created_at, Notification.id < note_id)
+        ))
+
+    notifications = (
+        query.order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+
     return jsonify({
         "status": "success",
-        "notifications": [
-            {"message": n.message, "timestamp": n.created_at.isoformat()} for n in notifications
+        "notifications": [notification_to_dict(n) for n in notifications],
+        "next_cursor": encode_cursor(notifications[-1]) if has_more else None
+    })
+
+
+@notifications_bp.route("/unread-count", methods=["GET"])
+def unread_count():
+    """Cheap poll target: counts only unread rows (partial index)."""
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    count = (
+        db.session.query(db.func.count(Notification.id))
+        .filter(Notification.user_id == session["user_id"], Notification.is_read == False)  # noqa: E712
+        .scalar()
+    )
+    return jsonify({"status": "success", "unread_count": count})
+
+
+@notifications_bp.route("/mark-read", methods=["POST"])
+def mark_read():
+    """
+    Mark many notifications read with one UPDATE.
+    Body: {"ids": [...]} or {"all": true}
+    """
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    data = request.get_json() or {}
+    query = Notification.query.filter(
+        Notification.user_id == session["user_id"],
+        Notification.is_read == False  # noqa: E712
+    )
+    if not data.get("all"):
+        ids = data.get("ids") or []
+        if not ids:
+            return jsonify({"status": "error", "message": "Give ids or all"}), 400
+        query = query.filter(Notification.id.in_(ids))
+
+    updated = query.update({Notification.is_read: True}, synchronize_session=False)
+    db.session.commit()
+    return jsonify({"status": "success", "updated": updated})
+
+
+@notifications_bp.route("/stream", methods=["GET"])
+def stream_notifications():
+    """
+    Server-Sent Events feed of new notifications for the logged-in user.
+    - Resumes after the Last-Event-ID header (or ?last_id=) by replaying
+      missed rows from the DB, then switches to live pushes
+    - More than SSE_REPLAY_LIMIT missed rows: sends one "resync" event
+      (refetch GET /notifications) instead of a partial replay, then goes live
+    - Sends a heartbeat comment every SSE_HEARTBEAT_SECONDS
+    - If the client falls SSE_QUEUE_SIZE events behind, sends a "resync"
+      event and closes; EventSource reconnects and resumes from its last id
+    Holds no DB connection while streaming.
+    """
+    if "user_id" not in session:
+        return jsonify({"status": "error", "message": "Not logged in"}), 401
+
+    user_id = session["user_id"]
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid last id"}), 400
+
+    # Subscribe first so nothing written during the replay is lost
+    sub = notification_bus.subscribe(user_id)
+    missed, resync_id = [], None
+    if last_id is not None:
+        missed = [
+            serialize(n) for n in Notification.query
+            .filter(Notification.user_id == user_id, Notification.id > last_id)
+            .order_by(Notification.id)
+            .limit(Config.SSE_REPLAY_LIMIT + 1)
         ]
+        if len(missed) > Config.SSE_REPLAY_LIMIT:
+            # Gap too large to replay: tell the client to refetch, and move its
+            # Last-Event-ID past the gap so a reconnect doesn't hit it again
+            missed = []
+            resync_id = (
+                db.session.query(db.func.max(Notification.id))
+                .filter(Notification.user_id == user_id)
+                .scalar()
+            )
+    db.session.remove()   # give the connection back before streaming
+
+    def event(row):
+        return f"id: {row['id']}\nevent: notification\ndata: {json.dumps(row)}\n\n"
+
+    def generate():
+        sent = last_id or 0
+        try:
+            yield "retry: 3000\n\n"
+            if resync_id is not None:
+                sent = resync_id
+                yield f"id: {resync_id}\nevent: resync\ndata: {{}}\n\n"
+            for row in missed:
+                sent = row["id"]
+                yield event(row)
+            while True:
+                if sub.overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                try:
+                    row = sub.queue.get(timeout=Config.SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                if row["id"] > sent:   # may already have come from the replay
+                    sent = row["id"]
+                    yield event(row)
+        finally:
+            notification_bus.unsubscribe(sub)
+
+    resp = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",   # nginx: don't buffer the stream
     })
+    resp.call_on_close(lambda: notification_bus.unsubscribe(sub))   # also if never iterated
+    return resp
+
+
+def archive_old_notifications(days=None, batch_size=5000):
+    """
+    Move read notifications older than `days` into notifications_archive,
+    batch_size rows per transaction so the hot table is never locked for long.
+    Returns the number of rows moved.
+    """
+    days = Config.NOTIFICATIONS_RETENTION_DAYS if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    moved = 0
+    while True:
+        ids = [
+            row[0] for row in db.session.query(Notification.id)
+            .filter(Notification.is_read == True, Notification.created_at < cutoff)  # noqa: E712
+            .order_by(Notification.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            return moved
+        db.session.execute(insert(NotificationArchive).from_select(
+            ["id", "user_id", "message", "is_read", "created_at"],
+            select(Notification.id, Notification.user_id, Notification.message,
+                   Notification.is_read, Notification.created_at)
+            .where(Notification.id.in_(ids))
+        ))
+        Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        moved += len(ids)
+
 
+@notifications_bp.cli.command("archive")
+@click.option("--days", type=int, default=None, help="Retention in days (default NOTIFICATIONS_RETENTION_DAYS)")
+def archive_command(days):
+    """Archive old read notifications (run daily, e.g. from cron)."""
+    print(f"Archived {archive_old_notifications(days)} notifications")
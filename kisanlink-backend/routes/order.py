@@ -1,6 +1,13 @@
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify
-from models_consumer import Order, OrderItem, Notification
-from db import db
+from extensions import db
+from models_order import Order, OrderItem
+from models_farmer_items import FarmerItem
+from models_notification import Notification
+from utils.notify_bus import notification_bus
+from utils.recommenders import clear_distance_recommendations, mark_returning_customer
+from utils.sales_rollup import record_sales
 
 order_bp = Blueprint("order", __name__)
 
@@ -8,27 +15,52 @@ order_bp = Blueprint("order", __name__)
 def create_order():
     data = request.json
 
+    # Prices come from the catalog, all products in one query
+    quantities = {item["product_id"]: item["quantity"] for item in data["items"]}
+    prices = dict(
+        db.session.query(FarmerItem.id, FarmerItem.price)
+        .filter(FarmerItem.id.in_(list(quantities)), FarmerItem.farmer_id == data["farmer_id"])
+        .all()
+    )
+    missing = [pid for pid in quantities if pid not in prices]
+    if missing:
+        return jsonify({"message": "Unknown products for this farmer", "product_ids": missing}), 400
+
+    now = datetime.utcnow()
     order = Order(
         consumer_id=data["consumer_id"],
-        farmer_id=data["farmer_id"]
+        total_amount=sum(prices[pid] * qty for pid, qty in quantities.items()),
+        created_at=now
     )
     db.session.add(order)
-    db.session.commit()
+    db.session.flush()  # assigns order.id
 
-    for item in data["items"]:
+    for product_id, quantity in quantities.items():
         order_item = OrderItem(
             order_id=order.id,
-            product_id=item["product_id"],
-            quantity=item["quantity"]
+            product_id=product_id,
+            farmer_id=data["farmer_id"],
+            quantity=quantity,
+            price=prices[product_id]
         )
         db.session.add(order_item)
+    record_sales([
+        (order.id, data["farmer_id"], product_id, quantity, prices[product_id])
+        for product_id, quantity in quantities.items()
+    ], now.date())
 
     notification = Notification(
         user_id=data["farmer_id"],
         message=f"New order received from customer {data['consumer_id']}"
     )
     db.session.add(notification)
+    db.session.flush()
+    notification_bus.publish(db.session, [notification])   # pushed to SSE clients on commit
+
+    clear_distance_recommendations(data["consumer_id"])   # now a returning customer
 
+    order_id = order.id
     db.session.commit()
+    mark_returning_customer(data["consumer_id"])
 
-    return jsonify({"message": "Order placed"})
\ No newline at end of file
+    return jsonify({"message": "Order placed", "order_id": order_id})
@@ -1,38 +1,89 @@
-from flask import Blueprint, jsonify
-from db import get_db_connection
+from flask import Blueprint, Response, json, jsonify, request, stream_with_context
+from db import db_connection
+from utils.catalog_cache import catalog_cached
 
 products_bp = Blueprint("products_bp", __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 500   # rows per round trip of the server-side cursor
+
+# Join farmer_items with users table to get farmer name and coordinates
+FARMER_ITEMS_QUERY = """
+    SELECT fi.id, fi.farmer_id, fi.item_name, fi.price, fi.photo_path, fi.location,
+           fi.min_order_qty, fi.available_stock,
+           u.fullname AS farmer_name, u.latitude AS farmer_lat, u.longitude AS farmer_lon,
+           fi.thumb_path, fi.medium_path
+    FROM farmer_items fi
+    JOIN users u ON u.id = fi.farmer_id
+"""
+
+
+def row_to_item(row):
+    return {
+        "id": row[0],
+        "farmer_id": row[1],
+        "item_name": row[2],
+        "price": row[3],
+        "photo_path": row[4],
+        "location": row[5],
+        "min_order_qty": row[6],
+        "available_stock": row[7],
+        "farmer_name": row[8],
+        "farmer_lat": row[9],
+        "farmer_lon": row[10],
+        "thumb_path": row[11],
+        "medium_path": row[12]
+    }
+
+
 @products_bp.route("/farmer-items", methods=["GET"])
+@catalog_cached()
 def get_farmer_items():
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Join farmer_items with users table to get farmer name and coordinates
-    cur.execute("""
-        SELECT fi.id, fi.farmer_id, fi.item_name, fi.price, fi.photo_path, fi.location,
-               fi.min_order_qty, fi.available_stock,
-               u.fullname AS farmer_name, u.latitude AS farmer_lat, u.longitude AS farmer_lon
-        FROM farmer_items fi
-        JOIN users u ON u.id = fi.farmer_id
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    items = []
-    for row in rows:
-        items.append({
-            "id": row[0],
-            "farmer_id": row[1],
-            "item_name": row[2],
-            "price": row[3],
-            "photo_path": row[4],
-            "location": row[5],
-            "min_order_qty": row[6],
-            "available_stock": row[7],
-            "farmer_name": row[8],
-            "farmer_lat": row[9],
-            "farmer_lon": row[10]
-        })
-    return jsonify(items)
+    """
+    Catalog of all farmer items.
+    - [?limit=N][&cursor=<last id>]: one page ordered by id (DEFAULT_PAGE_SIZE
+      when no limit), returns {"items": [...], "next_cursor": <id or null>}
+    - ?all=1: the full catalog as a JSON array, streamed from a
+      server-side cursor so it is never held in memory at once
+    """
+    if request.args.get("all") in ("1", "true"):
+        return Response(stream_with_context(stream_farmer_items()), mimetype="application/json")
+
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor", 0, type=int)
+    if not limit or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Keyset pagination: seek past the last id instead of OFFSET
+        cur.execute(FARMER_ITEMS_QUERY + " WHERE fi.id > %s ORDER BY fi.id LIMIT %s",
+                    (cursor, limit + 1))
+        rows = cur.fetchall()
+        cur.close()
+
+    has_more = len(rows) > limit
+    items = [row_to_item(r) for r in rows[:limit]]
+    return jsonify({
+        "items": items,
+        "next_cursor": items[-1]["id"] if has_more else None
+    })
+
+
+def stream_farmer_items():
+    """Yield the catalog as a JSON array, one row at a time."""
+    with db_connection() as conn:
+        # Named cursor = server-side cursor; rows arrive STREAM_BATCH_SIZE at a time
+        cur = conn.cursor(name="farmer_items_export")
+        cur.itersize = STREAM_BATCH_SIZE
+        cur.execute(FARMER_ITEMS_QUERY + " ORDER BY fi.id")
+
+        yield "["
+        first = True
+        for row in cur:
+            yield ("" if first else ",") + json.dumps(row_to_item(row))
+            first = False
+        yield "]"
+        cur.close()
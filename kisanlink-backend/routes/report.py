@@ -1,164 +1,163 @@
-from flask import Blueprint, jsonify, send_file
+from flask import Blueprint, jsonify, send_file, url_for
 from flask import current_app as app
-import psycopg2
-import io
-from reportlab.pdfgen import canvas
+import os
+import click
+from db import db_connection
+from utils.report_pdf import cache_path, mark_served, pdf_jobs, report_digest
+from utils.sales_rollup import backfill, reconcile
 
 report_bp = Blueprint('report_bp', __name__)
 
-# Database connection helper
-def get_db_connection():
-    conn = psycopg2.connect(
-        host="localhost",
-        database="kisanlink_db",
-        user="kisanlink_user",
-        password="password123"
-    )
-    return conn
-
-# --------- Endpoint: Get report data as JSON ----------
-@report_bp.route('/api/farmer/report/<int:farmer_id>', methods=['GET'])
-def get_report(farmer_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Total Revenue
-    cur.execute("""
-        SELECT COALESCE(SUM(total_price),0) 
-        FROM orders 
-        WHERE farmer_id=%s;
-    """, (farmer_id,))
-    total_revenue = cur.fetchone()[0]
-
-    # Total Orders
-    cur.execute("""
-        SELECT COUNT(*) 
-        FROM orders 
-        WHERE farmer_id=%s;
-    """, (farmer_id,))
-    total_orders = cur.fetchone()[0]
-
-    # Most Sold Product
-    cur.execute("""
-        SELECT fi.item_name, SUM(o.quantity) AS total_sold
-        FROM orders o
-        JOIN farmer_items fi ON o.item_id = fi.id
-        WHERE o.farmer_id=%s
+LOW_STOCK_THRESHOLD = 15
+
+# All report sections in one round trip. Sales come from the daily
+# rollups (utils/sales_rollup.py), so the cost depends on how many days and
+# products a farmer has sold, not on lifetime order volume; JSON
+# aggregation returns the chart/table sections as single columns.
+REPORT_QUERY = """
+    WITH by_product AS (
+        SELECT fi.item_name, SUM(s.quantity) AS sold, SUM(s.revenue) AS revenue
+        FROM daily_farmer_sales s
+        JOIN farmer_items fi ON fi.id = s.product_id
+        WHERE s.farmer_id = %(farmer_id)s
         GROUP BY fi.item_name
-        ORDER BY total_sold DESC
-        LIMIT 1;
-    """, (farmer_id,))
-    most_sold = cur.fetchone()
-    most_sold_product = most_sold[0] if most_sold else "N/A"
-
-    # Low Stock Items
-    cur.execute("""
-        SELECT item_name, available_stock
-        FROM farmer_items
-        WHERE farmer_id=%s AND available_stock < 15;
-    """, (farmer_id,))
-    low_stock_items = cur.fetchall()
-    low_stock_count = len(low_stock_items)
-
-    # Sales Trend (Line chart)
-    cur.execute("""
-        SELECT DATE(order_date) AS date, COALESCE(SUM(total_price),0) AS revenue
-        FROM orders
-        WHERE farmer_id=%s
-        GROUP BY DATE(order_date)
-        ORDER BY date;
-    """, (farmer_id,))
-    sales_trend = [{"date": str(r[0]), "sales": float(r[1])} for r in cur.fetchall()]
-
-    # Revenue Breakdown (Pie chart)
-    cur.execute("""
-        SELECT fi.item_name, COALESCE(SUM(o.total_price),0) AS revenue
-        FROM orders o
-        JOIN farmer_items fi ON o.item_id = fi.id
-        WHERE o.farmer_id=%s
-        GROUP BY fi.item_name;
-    """, (farmer_id,))
-    revenue_breakdown = [{"product": r[0], "value": float(r[1])} for r in cur.fetchall()]
-
-    # Inventory Table
-    cur.execute("""
+    ),
+    by_day AS (
+        SELECT day, order_count, revenue
+        FROM daily_farmer_orders
+        WHERE farmer_id = %(farmer_id)s
+    ),
+    inventory AS (
         SELECT item_name, available_stock
         FROM farmer_items
-        WHERE farmer_id=%s;
-    """, (farmer_id,))
-    inventory_table = [{"product": r[0], "stock": r[1]} for r in cur.fetchall()]
-
+        WHERE farmer_id = %(farmer_id)s
+    )
+    SELECT
+        (SELECT COALESCE(SUM(revenue), 0) FROM by_day),
+        (SELECT COALESCE(SUM(order_count), 0) FROM by_day),
+        (SELECT item_name FROM by_product ORDER BY sold DESC LIMIT 1),
+        (SELECT COUNT(*) FROM inventory WHERE available_stock < %(low_stock)s),
+        (SELECT json_agg(json_build_array(day, revenue) ORDER BY day) FROM by_day),
+        (SELECT json_agg(json_build_array(item_name, revenue) ORDER BY item_name) FROM by_product),
+        (SELECT json_agg(json_build_array(item_name, available_stock) ORDER BY item_name) FROM inventory)
+"""
+
+
+def build_report(conn, farmer_id):
+    """
+    Farmer report data shared by the JSON and PDF endpoints, so they can't diverge.
+    Runs exactly one query on `conn`.
+    """
+    cur = conn.cursor()
+    cur.execute(REPORT_QUERY, {"farmer_id": farmer_id, "low_stock": LOW_STOCK_THRESHOLD})
+    (total_revenue, total_orders, most_sold, low_stock,
+     trend, breakdown, inventory) = cur.fetchone()
     cur.close()
-    conn.close()
 
-    return jsonify({
+    return {
         "summary": {
             "totalRevenue": float(total_revenue),
             "totalOrders": total_orders,
-            "mostSoldProduct": most_sold_product,
-            "lowStock": low_stock_count
+            "mostSoldProduct": most_sold or "N/A",
+            "lowStock": low_stock
         },
-        "salesTrend": sales_trend,
-        "revenueBreakdown": revenue_breakdown,
-        "inventoryTable": inventory_table
-    })
+        "salesTrend": [{"date": str(day), "sales": float(revenue)} for day, revenue in trend or []],
+        "revenueBreakdown": [{"product": name, "value": float(revenue)} for name, revenue in breakdown or []],
+        "inventoryTable": [{"product": name, "stock": stock} for name, stock in inventory or []]
+    }
 
 
-# --------- Endpoint: Download PDF ----------
+# --------- Endpoint: Get report data as JSON ----------
+@report_bp.route('/api/farmer/report/<int:farmer_id>', methods=['GET'])
+def get_report(farmer_id):
+    with db_connection() as conn:
+        report = build_report(conn, farmer_id)
+    return jsonify(report)
+
+
+# --------- PDF: rendered in the background, cached on disk ----------
+def _pdf_job_response(job):
+    body = {"status": job["status"], "job_id": job["id"], "error": job["error"]}
+    if job["status"] == "done":
+        mark_served(cache_path(job["farmer_id"], job["digest"]))   # not pruned before the client fetches it
+        body["download_url"] = url_for("report_bp.download_cached_pdf",
+                                       farmer_id=job["farmer_id"], digest=job["digest"])
+        return jsonify(body), 200
+    body["status_url"] = url_for("report_bp.pdf_job_status", job_id=job["id"])
+    return jsonify(body), 500 if job["status"] == "error" else 202
+
+
+def _request_pdf(farmer_id):
+    """One report query; returns (digest, cached path or None, report)."""
+    with db_connection() as conn:
+        report = build_report(conn, farmer_id)
+    digest = report_digest(farmer_id, report)
+    path = cache_path(farmer_id, digest)
+    return digest, (path if os.path.exists(path) else None), report
+
+
+# Start (or join) a render; 200 with download_url if already cached, else 202 + status_url
+@report_bp.route('/api/farmer/report/pdf/<int:farmer_id>/jobs', methods=['POST'])
+def start_pdf_job(farmer_id):
+    digest, path, report = _request_pdf(farmer_id)
+    if path:
+        job = {"id": f"{farmer_id}-{digest}", "farmer_id": farmer_id, "digest": digest, "status": "done", "error": None}
+    else:
+        job = pdf_jobs.submit(farmer_id, digest, report)
+    return _pdf_job_response(job)
+
+
+@report_bp.route('/api/farmer/report/pdf/jobs/<job_id>', methods=['GET'])
+def pdf_job_status(job_id):
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return _pdf_job_response(job)
+
+
+# A specific data version: never changes, so clients and proxies may keep it
+@report_bp.route('/api/farmer/report/pdf/<int:farmer_id>/<digest>.pdf', methods=['GET'])
+def download_cached_pdf(farmer_id, digest):
+    if not digest.isalnum():
+        return jsonify({"status": "error", "message": "Report not found"}), 404
+    path = cache_path(farmer_id, digest)
+    if not os.path.exists(path):
+        return jsonify({"status": "error", "message": "Report not found"}), 404
+    resp = send_file(path, as_attachment=True, download_name="farmer_report.pdf",
+                     mimetype="application/pdf", max_age=31536000)
+    resp.headers["Cache-Control"] += ", immutable"
+    return resp
+
+
+# Latest report: served from the cache when current, otherwise queued (202)
 @report_bp.route('/api/farmer/report/pdf/<int:farmer_id>', methods=['GET'])
 def download_report_pdf(farmer_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Fetch summary
-    cur.execute("""
-        SELECT COALESCE(SUM(total_price),0), COUNT(*)
-        FROM orders
-        WHERE farmer_id=%s;
-    """, (farmer_id,))
-    total_revenue, total_orders = cur.fetchone()
-
-    cur.execute("""
-        SELECT fi.item_name, SUM(o.quantity) AS total_sold
-        FROM orders o
-        JOIN farmer_items fi ON o.item_id = fi.id
-        WHERE o.farmer_id=%s
-        GROUP BY fi.item_name
-        ORDER BY total_sold DESC
-        LIMIT 1;
-    """, (farmer_id,))
-    most_sold = cur.fetchone()
-    most_sold_product = most_sold[0] if most_sold else "N/A"
-
-    cur.execute("""
-        SELECT item_name, available_stock
-        FROM farmer_items
-        WHERE farmer_id=%s;
-    """, (farmer_id,))
-    inventory = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    # Generate PDF
-    buffer = io.BytesIO()
-    pdf = canvas.Canvas(buffer)
-    pdf.setTitle("Farmer Report")
-
-    pdf.setFont("Helvetica-Bold", 20)
-    pdf.drawString(50, 800, "KisanLink Farmer Report")
-
-    pdf.setFont("Helvetica", 14)
-    pdf.drawString(50, 760, f"Total Revenue: Rs. {total_revenue}")
-    pdf.drawString(50, 740, f"Total Orders: {total_orders}")
-    pdf.drawString(50, 720, f"Most Sold Product: {most_sold_product}")
-
-    pdf.drawString(50, 690, "Inventory:")
-    y = 670
-    for item_name, stock in inventory:
-        pdf.drawString(60, y, f"{item_name} - Stock: {stock}")
-        y -= 20
-
-    pdf.save()
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name="farmer_report.pdf", mimetype="application/pdf")
+    digest, path, report = _request_pdf(farmer_id)
+    if path:
+        return send_file(path, as_attachment=True, download_name="farmer_report.pdf", mimetype="application/pdf")
+    return _pdf_job_response(pdf_jobs.submit(farmer_id, digest, report))
+
+
+# --------- Rollup maintenance (flask report_bp ...) ----------
+@report_bp.cli.command("backfill-rollups")
+@click.option("--farmer-id", type=int, default=None, help="Rebuild one farmer only")
+def backfill_rollups_command(farmer_id):
+    """Rebuild daily_farmer_sales/daily_farmer_orders from the order tables."""
+    backfill(farmer_id)
+    print("Rollups rebuilt" + (f" for farmer {farmer_id}" if farmer_id is not None else ""))
+
+
+@report_bp.cli.command("reconcile-rollups")
+@click.option("--fix", is_flag=True, help="Rebuild the farmers that don't match")
+def reconcile_rollups_command(fix):
+    """Check the rollups against the order tables; exits 1 on mismatch unless --fix."""
+    mismatched = reconcile()
+    if not mismatched:
+        print("Rollups match the order tables")
+        return
+    print(f"Rollups differ for farmers: {mismatched}")
+    if not fix:
+        raise SystemExit(1)
+    for farmer_id in mismatched:
+        backfill(farmer_id)
+    print(f"Rebuilt {len(mismatched)} farmers")
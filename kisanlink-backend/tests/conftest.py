@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+from extensions import db
+from models_farmer_items import FarmerItem
+from models_user import User
+import models_notification  # noqa: F401  (create_all)
+import models_recommendation  # noqa: F401  (create_all)
+import models_sales_rollup  # noqa: F401  (create_all)
+import models_stock_hold  # noqa: F401  (create_all)
+from routes.cart import cart_bp
+
+
+@pytest.fixture
+def app():
+    """The cart blueprint on an in-memory SQLite database."""
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    app.register_blueprint(cart_bp, url_prefix="/cart")
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def login(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+    return client
+
+
+def make_user(name):
+    user = User(fullname=name, username=name, email=f"{name}@test.local", password="x")
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def make_product(farmer_id, name, stock, price=10, min_qty=1):
+    product = FarmerItem(farmer_id=farmer_id, item_name=name, price=price,
+                         min_order_qty=min_qty, available_stock=stock)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
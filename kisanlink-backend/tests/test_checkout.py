@@ -0,0 +1,97 @@
+from sqlalchemy import event
+
+from conftest import login, make_product, make_user
+from extensions import db
+from models_cart import CartItem
+from models_farmer_items import FarmerItem
+from models_order import Order, OrderItem
+
+
+def add(client, product_id, quantity):
+    resp = client.post("/cart/", json={"product_id": product_id, "quantity": quantity})
+    assert resp.status_code == 200, resp.get_json()
+    return next(line["id"] for line in resp.get_json()["cart"] if line["product_id"] == product_id)
+
+
+def stock(product_id):
+    db.session.expire_all()
+    return db.session.get(FarmerItem, product_id).available_stock
+
+
+def test_partial_checkout_places_what_fits(app):
+    farmer_a, farmer_b, consumer = make_user("farmer-a"), make_user("farmer-b"), make_user("consumer")
+    tomato = make_product(farmer_a, "Tomato", stock=5)
+    onion = make_product(farmer_b, "Onion", stock=10)
+    client = login(app, consumer)
+    tomato_line, onion_line = add(client, tomato, 3), add(client, onion, 4)
+
+    # Sold elsewhere after it was carted: only 2 tomatoes left
+    db.session.get(FarmerItem, tomato).available_stock = 2
+    db.session.commit()
+
+    body = client.post("/cart/checkout", json={"item_ids": [tomato_line, onion_line]}).get_json()
+
+    assert body["status"] == "partial"
+    assert "Tomato" in body["message"] and "still in your cart" in body["message"]
+    assert [d["item_name"] for d in body["order_details"]] == ["Onion"]
+    assert [f["id"] for f in body["failed"]] == [tomato_line]
+    assert len(body["order_ids"]) == 1
+    assert stock(onion) == 6
+    assert stock(tomato) == 2
+    assert [c.id for c in CartItem.query.all()] == [tomato_line]   # failed line stays in the cart
+    assert [(i.product_id, i.quantity) for i in OrderItem.query.all()] == [(onion, 4)]
+
+
+def test_checkout_with_nothing_in_stock_changes_nothing(app):
+    farmer, consumer = make_user("farmer"), make_user("consumer")
+    tomato = make_product(farmer, "Tomato", stock=5)
+    client = login(app, consumer)
+    line = add(client, tomato, 5)
+    db.session.get(FarmerItem, tomato).available_stock = 1
+    db.session.commit()
+
+    resp = client.post("/cart/checkout", json={"item_ids": [line]})
+
+    assert resp.status_code == 409
+    assert [f["id"] for f in resp.get_json()["failed"]] == [line]
+    assert stock(tomato) == 1
+    assert Order.query.count() == 0
+    assert CartItem.query.count() == 1
+
+
+def test_holds_of_other_carts_count_against_checkout(app):
+    farmer, first, second = make_user("farmer"), make_user("first"), make_user("second")
+    tomato = make_product(farmer, "Tomato", stock=5)
+    add(login(app, first), tomato, 4)
+    second_client = login(app, second)
+
+    # Only 1 left for the second cart while the first one holds 4
+    assert second_client.post("/cart/", json={"product_id": tomato, "quantity": 2}).status_code == 400
+    line = add(second_client, tomato, 1)
+    body = second_client.post("/cart/checkout", json={"item_ids": [line]}).get_json()
+
+    assert body["status"] == "success"
+    assert stock(tomato) == 4
+
+
+def test_batch_update_locks_products_in_id_order(app):
+    farmer, consumer = make_user("farmer"), make_user("consumer")
+    products = [make_product(farmer, f"Item {i}", stock=10) for i in range(3)]
+    client = login(app, consumer)
+    # Cart ids run opposite to product ids
+    lines = [add(client, product_id, 1) for product_id in reversed(products)]
+    assert lines == sorted(lines)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        resp = client.put("/cart/batch", json={"items": [{"id": line, "quantity": 2} for line in lines]})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert resp.status_code == 200, resp.get_json()
+    assert all(line["quantity"] == 2 for line in resp.get_json()["changed"])
+    # SQLite has no FOR UPDATE; the locking read is the one that joins the cart to products
+    locking = next(s for s in statements if "FROM cart_items JOIN farmer_items" in s)
+    assert "ORDER BY farmer_items.id" in locking
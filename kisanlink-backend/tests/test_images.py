@@ -0,0 +1,25 @@
+import io
+import os
+import stat
+
+from PIL import Image
+
+from config import Config
+from utils.images import UMASK, ingest_upload, make_variants
+
+
+class Upload:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+
+def test_originals_get_the_same_mode_as_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_FOLDER", str(tmp_path))
+    png = io.BytesIO()
+    Image.new("RGB", (40, 40), "green").save(png, "PNG")
+
+    filename, digest = ingest_upload(Upload(png.getvalue()))
+    variants = make_variants(filename, digest)
+
+    modes = {name: stat.S_IMODE(os.stat(tmp_path / name).st_mode) for name in [filename, *variants.values()]}
+    assert set(modes.values()) == {0o644 & ~UMASK}
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import utils.query_profiler as query_profiler
+from utils.query_profiler import ProfileWriter, explain_mode
+
+
+@pytest.mark.parametrize("statement, mode", [
+    ("SELECT * FROM farmer_items WHERE updated_at > %s", "analyze"),
+    ("WITH recent AS (SELECT id FROM orders) SELECT count(*) FROM recent", "analyze"),
+    ("SELECT pg_notify(%s, %s)", "plan"),
+    ("SELECT nextval('orders_id_seq')", "plan"),
+    ("select setval('orders_id_seq', 10)", "plan"),
+    ("SELECT pg_advisory_xact_lock(1)", "plan"),
+    ("SELECT * FROM farmer_items WHERE id IN (1, 2) FOR UPDATE", "plan"),
+    ("WITH gone AS (DELETE FROM stock_holds RETURNING *) SELECT count(*) FROM gone", "plan"),
+    ("INSERT INTO orders (consumer_id) VALUES (1)", None),
+    ("UPDATE farmer_items SET available_stock = 0", None),
+    ("DELETE FROM cart_items", None),
+])
+def test_explain_mode(statement, mode):
+    assert explain_mode(statement) == mode
+
+
+def test_writer_only_explains_reads(tmp_path, monkeypatch):
+    explained = []
+    monkeypatch.setattr(query_profiler, "explain",
+                        lambda statement, params, timeout_ms, analyze=True: explained.append((statement, analyze)) or [])
+    writer = ProfileWriter(str(tmp_path / "profile.jsonl"))
+    slow = [
+        {"statement": s, "ms": 500, "params": None, "explainable": True}
+        for s in ("SELECT * FROM orders", "SELECT pg_notify('c', 'x')", "UPDATE orders SET status = 'Paid'")
+    ]
+    slow.append({"statement": "SELECT * FROM users", "ms": 500, "params": None, "explainable": False})
+
+    writer._run({"endpoint": "test"}, slow)
+
+    assert explained == [("SELECT * FROM orders", True), ("SELECT pg_notify('c', 'x')", False)]
+    record = json.loads((tmp_path / "profile.jsonl").read_text())
+    assert [e.get("analyzed") for e in record["slow"]] == [True, False, None, None]
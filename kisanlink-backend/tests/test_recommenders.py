@@ -0,0 +1,60 @@
+import time
+
+from extensions import db
+from models_order import Order, OrderItem
+from utils.recommenders import CoOccurrenceModel
+
+
+def order(consumer_id, *lines):
+    """lines: (order_items.id, product_id); explicit ids stand in for ids taken by other transactions."""
+    o = Order(consumer_id=consumer_id, total_amount=1)
+    db.session.add(o)
+    db.session.flush()
+    db.session.add_all([
+        OrderItem(id=line_id, order_id=o.id, product_id=product_id, farmer_id=1, quantity=1, price=1)
+        for line_id, product_id in lines
+    ])
+    db.session.commit()
+
+
+def test_refresh_picks_up_lines_committed_out_of_id_order(app):
+    model = CoOccurrenceModel(batch_size=2, overlap=100)
+    order(1, (1, 10), (2, 11))
+    order(2, (3, 10), (5, 12))   # id 4 is taken by a transaction that hasn't committed yet
+    model.refresh()
+    assert model.last_line_id == 5
+    assert model.baskets[2] == {10, 12}
+
+    order(2, (4, 11))            # ...and commits now, below the high-water mark
+    model.refresh()
+
+    assert model.baskets[2] == {10, 11, 12}
+    assert dict(model.counts) == {10: 2, 11: 2, 12: 1}
+    assert model.pairs[10][11] == 2
+
+
+def test_refresh_does_not_count_a_line_twice(app):
+    model = CoOccurrenceModel(overlap=100)
+    order(1, (1, 10), (2, 11))
+    model.refresh()
+    model.refresh()
+    model.refresh()
+
+    assert dict(model.counts) == {10: 1, 11: 1}
+    assert model.pairs[10] == {11: 1}
+
+
+def test_first_build_runs_in_the_background(app):
+    order(1, (1, 10), (2, 11))
+    order(2, (3, 10))
+    model = CoOccurrenceModel()
+
+    with app.test_request_context():
+        model.ensure_fresh()       # returns at once; the build runs on a helper thread
+        assert model.start_build(app) is None   # one build per process
+
+    deadline = time.monotonic() + 5
+    while not model.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.ready
+    assert model.recommend(2) and model.recommend(2)[0][0] == 11
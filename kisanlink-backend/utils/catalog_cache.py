@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from config import Config
+
+VERSION_KEY = "catalog:version"
+
+
+class MemoryBackend:
+    """
+    In-process LRU cache with a per-entry TTL.
+    Any object with the same get/set/incr methods (e.g. a Redis wrapper)
+    can be plugged in with set_backend() to share the cache across workers.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._counters = {}          # never evicted (catalog version lives here)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+_backend = MemoryBackend(Config.CATALOG_CACHE_SIZE)
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    """The active backend; other small shared counters (e.g. profile versions) live here too."""
+    return _backend
+
+
+def catalog_version():
+    return _backend.get(VERSION_KEY) or 0
+
+
+def bump_catalog_version():
+    """Call after any write that changes what the catalog endpoints return."""
+    return _backend.incr(VERSION_KEY)
+
+
+def catalog_cached(per_user=False):
+    """
+    Read-through cache for catalog GET endpoints.
+    - Key: path + query args (+ session user when per_user) + catalog version,
+      so a version bump invalidates every entry at once
+    - Entries hold (etag, body); the ETag is a hash of the body, and a
+      matching If-None-Match gets a 304 without calling the view or
+      touching the DB
+    - Streamed responses aren't stored; they get an ETag derived from the
+      key (so from the catalog version) and the entry holds (etag, None),
+      so the next matching If-None-Match is answered before the view opens
+      its cursor
+    Only 200 responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = session.get("user_id") if per_user else None
+            if per_user and not user_id:
+                return view(*args, **kwargs)
+
+            args_key = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            key = f"catalog:{catalog_version()}:{user_id}:{request.path}?{args_key}"
+
+            entry = _backend.get(key)
+            if entry is not None and entry[0] in request.if_none_match:
+                etag = entry[0]
+                resp = Response(status=304)
+            elif entry is not None and entry[1] is not None:
+                etag, body = entry
+                resp = Response(body, mimetype="application/json")
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                if resp.is_streamed:
+                    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+                    _backend.set(key, (etag, None), ttl=Config.CATALOG_CACHE_TTL)
+                else:
+                    body = resp.get_data()
+                    etag = hashlib.sha1(body).hexdigest()[:20]
+                    _backend.set(key, (etag, body), ttl=Config.CATALOG_CACHE_TTL)
+                    if etag in request.if_none_match:
+                        resp = Response(status=304)
+
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "private, no-cache" if per_user else "no-cache"
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+import time
+
+from flask import g, session
+from config import Config
+from db import db_connection
+from utils.catalog_cache import get_backend
+
+PROFILE_QUERY = "SELECT id, fullname, email, user_type, location, latitude, longitude FROM users WHERE id=%s"
+PROFILE_FIELDS = ("id", "fullname", "email", "user_type", "location", "latitude", "longitude")
+
+
+def _version(user_id):
+    return get_backend().get(f"profile:version:{user_id}") or 0
+
+
+def load_profile(user_id):
+    """The users row as a profile dict (one query), or None."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(PROFILE_QUERY, (user_id,))
+        row = cur.fetchone()
+        cur.close()
+    return dict(zip(PROFILE_FIELDS, row)) if row else None
+
+
+def remember_profile(profile):
+    """
+    Keep the profile in the (signed) session cookie, stamped with the
+    user's profile version and the load time.
+    """
+    session["profile"] = dict(profile, v=_version(profile["id"]), at=time.time())
+
+
+def invalidate_profile(user_id):
+    """
+    Call after changing a users row. Sessions holding the old copy reload
+    it on their next request in this process (or in every process when a
+    shared cache backend is plugged in); elsewhere it expires after PROFILE_TTL.
+    """
+    get_backend().incr(f"profile:version:{user_id}")
+
+
+def current_user():
+    """
+    The logged-in user's profile dict, or None.
+    Resolved at most once per request (kept on flask.g). Normally comes
+    straight from the session; the DB is read only when the cached copy
+    is missing, invalidated or older than PROFILE_TTL.
+    """
+    if "current_user" in g:
+        return g.current_user
+
+    profile = None
+    user_id = session.get("user_id")
+    if user_id is not None:
+        cached = session.get("profile")
+        if (cached and cached.get("id") == user_id and cached.get("v") == _version(user_id)
+                and time.time() - cached.get("at", 0) < Config.PROFILE_TTL):
+            profile = cached
+        else:
+            profile = load_profile(user_id)
+            if profile:
+                remember_profile(profile)
+            else:
+                session.pop("profile", None)
+
+    g.current_user = {k: profile[k] for k in PROFILE_FIELDS} if profile else None
+    return g.current_user
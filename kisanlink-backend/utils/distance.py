@@ -1,12 +1,19 @@
+import heapq
 import math
 
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback below
+    np = None
+
+R = 6371  # Earth radius in km
+
 def haversine(lat1, lon1, lat2, lon2):
     """
-    Calculate the great-circle distance between two points 
+    Calculate the great-circle distance between two points
     on the Earth using Haversine formula.
     Returns distance in KM.
     """
-    R = 6371  # Earth radius in km
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
 
@@ -14,3 +21,52 @@ def haversine(lat1, lon1, lat2, lon2):
         * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Distance in KM from one origin (lat, lon) to every point in lats/lons.
+    Uses NumPy when available, otherwise loops in Python.
+    Points with a missing coordinate get distance inf.
+    Returns a NumPy array or a list, matching the backend used.
+    """
+    if np is not None:
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        lat1 = math.radians(lat)
+        lat2 = np.radians(lats)
+        dlat = lat2 - lat1
+        dlon = np.radians(lons - lon)
+        a = np.sin(dlat/2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+        d = 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        d[np.isnan(d)] = np.inf   # None/NaN coordinates
+        return d
+
+    return [
+        haversine(lat, lon, la, lo) if la is not None and lo is not None else math.inf
+        for la, lo in zip(lats, lons)
+    ]
+
+
+def nearest(distances, limit=None, radius_km=None):
+    """
+    Indexes of the closest points, nearest first.
+    - radius_km: drop points further away than this
+    - limit: keep only the `limit` closest (partial selection, no full sort)
+    """
+    if np is not None and isinstance(distances, np.ndarray):
+        idx = np.flatnonzero(np.isfinite(distances))
+        if radius_km is not None:
+            idx = idx[distances[idx] <= radius_km]
+        if limit is not None and limit < len(idx):
+            # argpartition is O(n); only the selected `limit` get sorted
+            idx = idx[np.argpartition(distances[idx], limit)[:limit]]
+        return idx[np.argsort(distances[idx], kind="stable")].tolist()
+
+    candidates = [
+        i for i, d in enumerate(distances)
+        if d != math.inf and (radius_km is None or d <= radius_km)
+    ]
+    if limit is not None and limit < len(candidates):
+        return heapq.nsmallest(limit, candidates, key=distances.__getitem__)
+    return sorted(candidates, key=distances.__getitem__)
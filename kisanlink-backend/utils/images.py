@@ -0,0 +1,170 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from config import Config
+from db import db_connection
+from utils.catalog_cache import bump_catalog_version
+
+CHUNK_SIZE = 64 * 1024
+FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}   # Pillow format -> extension
+
+# name -> (box, crop): "thumb" fills a square for product cards, "medium" fits inside the box
+VARIANTS = {
+    "thumb": ((320, 320), True),
+    "medium": ((1024, 1024), False),
+}
+
+# Process umask, read once at import (setting it is the only way to read it,
+# which isn't thread-safe later); originals get the mode a plain open() gives
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def ingest_upload(file):
+    """
+    Store an uploaded photo under its content hash.
+    Streams the upload to a temp file in CHUNK_SIZE pieces while hashing it,
+    checks that it really is an image, then renames it to <sha256>.<ext>.
+    An identical photo already on disk is reused (the temp copy is dropped).
+    Returns (filename, digest).
+    """
+    folder = Config.UPLOAD_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".upload")
+    try:
+        sha, size = hashlib.sha256(), 0
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > Config.MAX_IMAGE_BYTES:
+                    raise InvalidImage(f"Image larger than {Config.MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+                sha.update(chunk)
+                out.write(chunk)
+
+        try:
+            with Image.open(tmp) as im:
+                fmt = im.format
+                im.verify()
+        except Exception:
+            raise InvalidImage("File is not a valid image")
+        if fmt not in FORMATS:
+            raise InvalidImage("Unsupported image type")
+
+        digest = sha.hexdigest()
+        filename = f"{digest}.{FORMATS[fmt]}"
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp)   # same photo uploaded before
+        else:
+            # mkstemp files are 0600; the front server (x-accel/x-sendfile) must read them
+            os.chmod(tmp, 0o644 & ~UMASK)
+            os.replace(tmp, path)
+        return filename, digest
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def variant_name(digest, name):
+    return f"{digest}_{name}.webp"
+
+
+def ready_variants(digest):
+    """{"thumb_path", "medium_path"} if every variant of this photo exists, else None."""
+    paths = {f"{name}_path": variant_name(digest, name) for name in VARIANTS}
+    if all(os.path.exists(os.path.join(Config.UPLOAD_FOLDER, p)) for p in paths.values()):
+        return paths
+    return None
+
+
+def make_variants(filename, digest):
+    """Write the WebP variants of one stored photo (atomically); returns their paths."""
+    folder = Config.UPLOAD_FOLDER
+    paths = {}
+    with Image.open(os.path.join(folder, filename)) as original:
+        original = ImageOps.exif_transpose(original)   # camera photos are often stored rotated
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "A" in original.getbands() else "RGB")
+        for name, (box, crop) in VARIANTS.items():
+            if crop:
+                im = ImageOps.fit(original, box, Image.LANCZOS)
+            else:
+                im = original.copy()
+                im.thumbnail(box, Image.LANCZOS)
+            target = variant_name(digest, name)
+            tmp = os.path.join(folder, f"{target}.{threading.get_ident()}.tmp")
+            im.save(tmp, "WEBP", quality=80, method=4)
+            os.replace(tmp, os.path.join(folder, target))
+            paths[f"{name}_path"] = target
+    return paths
+
+
+class ImageJobs:
+    """
+    Builds photo variants on a small thread pool, off the request thread.
+    When a photo's variants are written, every farmer_items row using that
+    photo gets thumb_path/medium_path set, and cached catalog pages are
+    invalidated. Submit after the row referencing the photo is committed.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._pending = set()   # filenames queued or rendering
+        self._lock = threading.Lock()
+
+    def submit(self, filename, digest):
+        with self._lock:
+            if filename in self._pending:
+                return
+            self._pending.add(filename)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-variants")
+            self._executor.submit(self._run, filename, digest)
+
+    def _run(self, filename, digest):
+        try:
+            build_variants(filename, digest)
+        except Exception as e:
+            print("Image variant generation failed:", filename, e)
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+
+
+def build_variants(filename, digest):
+    """Make (or reuse) the variants of one photo and record them on its products."""
+    paths = ready_variants(digest) or make_variants(filename, digest)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE farmer_items SET thumb_path=%s, medium_path=%s WHERE photo_path=%s",
+            (paths["thumb_path"], paths["medium_path"], filename)
+        )
+        conn.commit()
+        cur.close()
+    bump_catalog_version()
+    return paths
+
+
+image_jobs = ImageJobs(workers=Config.IMAGE_WORKERS)
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
@@ -0,0 +1,165 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+from db import add_query_hook
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+# -----------------------------
+# Minimal Prometheus-style metrics
+# -----------------------------
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REQUEST_LABELS = ("endpoint", "method")
+
+request_seconds = Histogram("http_request_duration_seconds", "Request latency by endpoint.", REQUEST_LABELS)
+requests_total = Counter("http_requests_total", "Requests by endpoint and status.", REQUEST_LABELS + ("status",))
+request_queries = Histogram("http_request_db_queries", "DB queries issued per request.", REQUEST_LABELS,
+                            buckets=QUERY_COUNT_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in DB queries per request.", REQUEST_LABELS)
+db_queries_total = Counter("db_queries_total", "DB queries by driver (requests and background work).", ("driver",))
+db_seconds_total = Counter("db_query_seconds_total", "Time spent in DB queries by driver.", ("driver",))
+
+REGISTRY = (request_seconds, requests_total, request_queries, request_db_seconds, db_queries_total, db_seconds_total)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Per-request DB accounting
+# -----------------------------
+_request = threading.local()   # queries / db_seconds of the request on this thread
+
+
+def record_query(driver, statement, params, seconds):
+    """Query hook for both drivers: totals always, per-request stats inside a request."""
+    db_queries_total.inc((driver,))
+    db_seconds_total.inc((driver,), seconds)
+    if getattr(_request, "active", False):
+        _request.queries += 1
+        _request.db_seconds += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    record_query("sqlalchemy", statement, parameters, time.perf_counter() - started)
+
+
+def _start_request():
+    _request.active = True
+    _request.queries = 0
+    _request.db_seconds = 0.0
+    g.metrics_started = time.perf_counter()
+
+
+def _finish_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    labels = (request.endpoint or "unmatched", request.method)
+    request_seconds.observe(elapsed, labels)
+    requests_total.inc(labels + (str(response.status_code),))
+    request_queries.observe(_request.queries, labels)
+    request_db_seconds.observe(_request.db_seconds, labels)
+    _request.active = False
+    return response
+
+
+def init_metrics(app):
+    """
+    Record per-endpoint latency, status counts and DB queries/time per request
+    (SQLAlchemy and the psycopg2 pool), and serve them on /metrics.
+    Counters are per process: with several workers, scrape each one.
+    Streamed responses are timed until the view returns, not until the last chunk.
+    """
+    if not Config.METRICS_ENABLED:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    add_query_hook(record_query)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype=None, content_type=CONTENT_TYPE)
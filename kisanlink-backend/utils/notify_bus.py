@@ -0,0 +1,158 @@
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import event, text
+from config import Config
+from extensions import db
+
+PG_NOTIFY_MAX_BYTES = 7900   # Postgres payload limit is 8000 bytes
+
+
+class Subscription:
+    """One connected client: a bounded queue plus an overflow flag."""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+
+class NotificationBus:
+    """
+    Fans newly written rows (notifications, chat messages) out to connected clients.
+    - local: rows handed to publish() are delivered when the writer's
+      session commits; only clients connected to this process see them
+      (single-node mode)
+    - postgres: writers NOTIFY inside their transaction (delivered on
+      commit), and one LISTEN connection per process fans out to its
+      clients, so every worker sees every row
+    A client whose queue fills up is flagged instead of blocking the
+    publisher; the stream then tells it to reconnect and resume from
+    its last event id.
+    """
+
+    def __init__(self, backend="local", channel="kisanlink_notifications", queue_size=100, serializer=None):
+        self.backend = backend
+        self.channel = channel
+        self.queue_size = queue_size
+        self.serializer = serializer or serialize   # row -> dict with "id" and "user_id" (recipient)
+        self._subs = {}   # user_id -> set of Subscription
+        self._lock = threading.Lock()
+        self._listener = None
+
+    # ------------------ Subscribers ------------------
+    def subscribe(self, user_id):
+        if self.backend == "postgres":
+            self._ensure_listener()
+        sub = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def dispatch(self, rows):
+        """Deliver rows ({"id", "user_id", ...}) to this process's subscribers."""
+        with self._lock:
+            for row in rows:
+                for sub in self._subs.get(row["user_id"], ()):
+                    try:
+                        sub.queue.put_nowait(row)
+                    except queue.Full:
+                        sub.overflowed = True
+
+    # ------------------ Writers ------------------
+    def publish(self, session, rows):
+        """
+        Announce freshly inserted rows.
+        Call before session.commit(); in local mode delivery happens on
+        commit via after_commit, in postgres mode via NOTIFY.
+        """
+        rows = [self.serializer(r) for r in rows]
+        if not rows:
+            return
+        if self.backend == "postgres":
+            for payload in _chunks(rows):
+                session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                {"channel": self.channel, "payload": payload})
+        else:
+            session.info.setdefault("pending_publish", []).append((self, rows))
+
+    # ------------------ Postgres listener ------------------
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="notify-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(host=Config.DB_HOST, port=Config.DB_PORT, database=Config.DB_NAME,
+                                        user=Config.DB_USER, password=Config.DB_PASSWORD)
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        self.dispatch(json.loads(note.payload))
+            except Exception as e:
+                print("Notification listener error, reconnecting:", e)
+                if conn is not None:
+                    conn.close()
+                time.sleep(2)
+
+
+def serialize(n):
+    return {
+        "id": n.id,
+        "user_id": n.user_id,
+        "message": n.message,
+        "timestamp": n.created_at.isoformat() if n.created_at else None,
+    }
+
+
+def _chunks(rows):
+    """JSON arrays of rows, each under the NOTIFY payload limit."""
+    chunk = []
+    for row in rows:
+        if chunk and len(json.dumps(chunk + [row])) > PG_NOTIFY_MAX_BYTES:
+            yield json.dumps(chunk)
+            chunk = []
+        chunk.append(row)
+    if chunk:
+        yield json.dumps(chunk)
+
+
+notification_bus = NotificationBus(
+    backend=Config.NOTIFY_BACKEND,
+    channel=Config.NOTIFY_CHANNEL,
+    queue_size=Config.SSE_QUEUE_SIZE,
+)
+
+
+# Local mode: deliver rows queued by publish() once their transaction commits
+@event.listens_for(db.session, "after_commit")
+def _deliver_on_commit(session):
+    for bus, rows in session.info.pop("pending_publish", ()):
+        bus.dispatch(rows)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("pending_publish", None)
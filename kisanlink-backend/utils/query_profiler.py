@@ -0,0 +1,234 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+from db import add_query_hook, db_connection
+
+WHITESPACE = re.compile(r"\s+")
+EXPLAINABLE = ("select", "with")   # only reads are explained at all
+# EXPLAIN ANALYZE runs the statement: reads that write (data-modifying CTEs),
+# lock rows or call functions with side effects only get a plain EXPLAIN
+SIDE_EFFECTS = re.compile(
+    r"\b(insert|update|delete|merge)\b"
+    r"|\bfor\s+(no\s+key\s+)?(update|share)\b|\bfor\s+key\s+share\b"
+    r"|\b(nextval|setval|pg_notify|set_config|pg_(try_)?advisory_\w+|lo_\w+|dblink\w*)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def normalize(statement):
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    return WHITESPACE.sub(" ", str(statement)).strip()
+
+
+def explain_mode(statement):
+    """"analyze" for plain reads, "plan" for reads with side effects, None for anything else."""
+    if not statement.lower().startswith(EXPLAINABLE):
+        return None
+    return "plan" if SIDE_EFFECTS.search(statement) else "analyze"
+
+
+# -----------------------------
+# Per-request capture
+# -----------------------------
+_request = threading.local()   # .queries: [(statement, params, seconds, explainable)] or None
+
+
+def _capture(statement, params, seconds, explainable):
+    queries = getattr(_request, "queries", None)
+    if queries is not None:
+        queries.append((statement, params, seconds, explainable))
+
+
+def _on_pool_query(driver, statement, params, seconds):
+    _capture(statement, params, seconds, True)   # the psycopg2 pool is always Postgres
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["profiler_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("profiler_started", None)
+    if started is None:
+        return
+    explainable = conn.dialect.name == "postgresql" and not executemany
+    _capture(statement, parameters, time.perf_counter() - started, explainable)
+
+
+def summarize(queries, repeat_threshold, slow_seconds):
+    """
+    Group one request's queries by statement text.
+    Returns (db_seconds, repeated, slow):
+    - repeated: statements run at least repeat_threshold times; distinct_params > 1
+      is the N+1 shape (same query in a loop), == 1 is the exact same query re-run
+    - slow: single executions over slow_seconds, with their parameters kept for EXPLAIN
+    """
+    groups = defaultdict(lambda: {"count": 0, "seconds": 0.0, "params": set()})
+    slow = []
+    for statement, params, seconds, explainable in queries:
+        text = normalize(statement)
+        group = groups[text]
+        group["count"] += 1
+        group["seconds"] += seconds
+        group["params"].add(repr(params))
+        if seconds >= slow_seconds:
+            slow.append({"statement": text, "ms": round(seconds * 1000, 2),
+                         "params": params, "explainable": explainable})
+    repeated = [
+        {"statement": text, "count": group["count"], "distinct_params": len(group["params"]),
+         "db_ms": round(group["seconds"] * 1000, 2)}
+        for text, group in groups.items() if group["count"] >= repeat_threshold
+    ]
+    repeated.sort(key=lambda r: r["count"], reverse=True)
+    db_seconds = sum(seconds for _, _, seconds, _ in queries)
+    return db_seconds, repeated, slow
+
+
+# -----------------------------
+# EXPLAIN + log writer (background)
+# -----------------------------
+def explain(statement, params, timeout_ms, analyze=True):
+    """
+    EXPLAIN one read statement in a rolled-back transaction: with
+    (ANALYZE, BUFFERS), which executes it, or the plan only.
+    """
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    with db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+            cur.execute(f"EXPLAIN ({options}) " + statement, params)
+            return cur.fetchone()[0]
+        finally:
+            cur.close()
+            conn.rollback()
+
+
+class ProfileWriter:
+    """
+    Runs EXPLAINs and appends JSON-lines records on one background thread, so
+    flagged requests don't pay for them. A statement is explained at most once
+    per explain_interval seconds per process.
+    """
+
+    def __init__(self, path, explain_interval=600):
+        self.path = path
+        self.explain_interval = explain_interval
+        self._executor = None
+        self._explained = {}   # statement -> time of last EXPLAIN
+        self._lock = threading.Lock()
+
+    def submit(self, record, slow):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-profiler")
+            self._executor.submit(self._run, record, slow)
+
+    def _due(self, statement):
+        now = time.time()
+        with self._lock:
+            if now - self._explained.get(statement, 0) < self.explain_interval:
+                return False
+            self._explained[statement] = now
+            return True
+
+    def _run(self, record, slow):
+        try:
+            for entry in slow:
+                params = entry.pop("params")
+                explainable = entry.pop("explainable")
+                mode = explain_mode(entry["statement"]) if explainable else None
+                if mode is None or not self._due(entry["statement"]):
+                    continue
+                entry["analyzed"] = mode == "analyze"
+                try:
+                    entry["plan"] = explain(entry["statement"], params, Config.QUERY_PROFILER_EXPLAIN_TIMEOUT_MS,
+                                            analyze=entry["analyzed"])
+                except Exception as e:
+                    entry["explain_error"] = str(e)
+            record["slow"] = slow
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except Exception as e:
+            print("Query profiler write failed:", e)
+
+
+profile_writer = ProfileWriter(Config.QUERY_PROFILER_LOG, Config.QUERY_PROFILER_EXPLAIN_INTERVAL)
+
+
+# -----------------------------
+# Flask hooks
+# -----------------------------
+def _start_request():
+    _request.queries = []
+    g.profiler_started = time.perf_counter()
+
+
+def _finish_request(response):
+    queries = getattr(_request, "queries", None)
+    _request.queries = None
+    started = g.pop("profiler_started", None)
+    if queries is None or started is None:
+        return response
+
+    db_seconds, repeated, slow = summarize(
+        queries, Config.QUERY_PROFILER_REPEAT_THRESHOLD, Config.QUERY_PROFILER_SLOW_MS / 1000
+    )
+    reasons = []
+    if len(queries) > Config.QUERY_PROFILER_MAX_QUERIES:
+        reasons.append("query_count")
+    if db_seconds * 1000 > Config.QUERY_PROFILER_MAX_DB_MS:
+        reasons.append("db_time")
+    if repeated:
+        reasons.append("repeated_statements")
+    if slow:
+        reasons.append("slow_statement")
+    if not reasons:
+        return response
+
+    record = {
+        "ts": time.time(),
+        "endpoint": request.endpoint or "unmatched",
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        "queries": len(queries),
+        "db_ms": round(db_seconds * 1000, 2),
+        "reasons": reasons,
+        "repeated": repeated,
+    }
+    profile_writer.submit(record, slow)
+    return response
+
+
+def init_query_profiler(app):
+    """
+    Opt-in (QUERY_PROFILER_ENABLED). Collects every query of each request and,
+    when the request crosses a threshold, appends a JSON record to
+    QUERY_PROFILER_LOG:
+      - reasons: query_count / db_time / repeated_statements / slow_statement
+      - repeated: statements run QUERY_PROFILER_REPEAT_THRESHOLD+ times (N+1 candidates)
+      - slow: statements over QUERY_PROFILER_SLOW_MS, with an EXPLAIN (ANALYZE, BUFFERS)
+        plan for Postgres reads (plan only for reads that lock rows or call
+        nextval/pg_notify/...; writes are not explained)
+    Parameters are used for EXPLAIN but never written to the log.
+    """
+    if not Config.QUERY_PROFILER_ENABLED:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    add_query_hook(_on_pool_query)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
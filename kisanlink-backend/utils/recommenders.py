@@ -0,0 +1,524 @@
+import heapq
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from config import Config
+from db import db_connection
+from extensions import db
+from models_farmer_items import FarmerItem
+from models_order import Order, OrderItem
+from models_recommendation import ConsumerRecommendation
+from models_sales_rollup import DailyFarmerSales
+from utils.distance import np
+from utils.spatial_index import spatial_index
+
+
+class CoOccurrenceModel:
+    """
+    Item-item recommender over who-bought-what.
+
+    The sparse co-occurrence matrix is kept as a dict of Counters:
+    pairs[i][j] = number of consumers who bought both i and j, and
+    counts[i] = number of consumers who bought i. Similarity is cosine,
+    pairs[i][j] / sqrt(counts[i] * counts[j]).
+
+    The model follows order_items by id: refresh() reads lines newer than
+    the last one applied, so new purchases are folded in without a rebuild,
+    and every worker process catches up with writes made by the others.
+    Ids are assigned at INSERT, not at commit, so a line can become visible
+    after higher ids were applied; each refresh re-reads the last `overlap`
+    ids and skips the ones already applied. Each product's top
+    RECOMMENDER_NEIGHBORS similar products are cached until a purchase
+    touches it.
+
+    The first (full) build runs on a background thread; until it finishes
+    the model is empty and callers fall back to distance-based lists.
+    """
+
+    def __init__(self, neighbors=50, refresh_seconds=30, batch_size=10000, overlap=1000):
+        self.neighbors = neighbors
+        self.refresh_seconds = refresh_seconds
+        self.batch_size = batch_size
+        self.overlap = overlap
+        self.baskets = {}    # consumer_id -> set of product ids bought
+        self.counts = Counter()
+        self.pairs = {}      # product_id -> Counter(other product_id -> co-buyers)
+        self.last_line_id = 0
+        self.ready = False   # first full build done
+        self._applied = set()   # line ids applied within the overlap window
+        self._top = {}       # product_id -> [(similarity, other product_id)], best first
+        self._checked_at = 0
+        self._lock = threading.RLock()           # model state
+        self._refresh_lock = threading.Lock()    # one refresh at a time
+        self._build_pid = None   # process the background build was started in
+
+    # ------------------ Updates ------------------
+    def add(self, consumer_id, product_ids):
+        """Fold one consumer's purchases in; repeat purchases change nothing."""
+        with self._lock:
+            basket = self.baskets.setdefault(consumer_id, set())
+            new = set(product_ids) - basket
+            if not new:
+                return
+            for p in new:
+                row = self.pairs.setdefault(p, Counter())
+                for q in basket:
+                    row[q] += 1
+                    self.pairs[q][p] += 1
+                for q in new:
+                    if q != p:
+                        row[q] += 1
+                self.counts[p] += 1
+            basket |= new
+
+            # counts[p] changed, so every similarity involving p did too
+            for p in new:
+                self._top.pop(p, None)
+                for q in self.pairs[p]:
+                    self._top.pop(q, None)
+
+    def refresh(self):
+        """Apply order lines written since the last refresh (all of them the first time)."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        # Batches are read without the model lock, so recommend() keeps
+        # answering during a long (first) build
+        cursor = max(self.last_line_id - self.overlap, 0)
+        while True:
+            rows = db.session.execute(
+                select(OrderItem.id, Order.consumer_id, OrderItem.product_id)
+                .join(Order, Order.id == OrderItem.order_id)
+                .where(OrderItem.id > cursor)
+                .order_by(OrderItem.id)
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                break
+            cursor = rows[-1][0]
+            by_consumer = {}
+            for line_id, consumer_id, product_id in rows:
+                if line_id not in self._applied:
+                    by_consumer.setdefault(consumer_id, []).append(product_id)
+            with self._lock:
+                for consumer_id, product_ids in by_consumer.items():
+                    self.add(consumer_id, product_ids)
+                self.last_line_id = max(self.last_line_id, cursor)
+            low = self.last_line_id - self.overlap
+            self._applied = {i for i in self._applied if i > low}
+            self._applied.update(line_id for line_id, _, _ in rows if line_id > low)
+        self.ready = True
+        self._checked_at = time.monotonic()
+
+    def start_build(self, app):
+        """
+        Run the first refresh on a helper thread, at most once per process
+        (threads don't survive fork). Returns the thread, or None if a build
+        was already started.
+        """
+        with self._lock:
+            if self._build_pid == os.getpid():
+                return None
+            self._build_pid = os.getpid()
+
+        def run():
+            try:
+                with app.app_context():
+                    self.refresh()
+            except Exception as e:
+                print("Recommender build failed:", e)
+                self._build_pid = None   # the next request retries
+
+        thread = threading.Thread(target=run, name="recommender-build", daemon=True)
+        thread.start()
+        return thread
+
+    def ensure_fresh(self):
+        """
+        Request path: never waits for the database work. Before the first
+        build this starts it in the background; afterwards it folds in new
+        lines unless another thread is already doing so.
+        """
+        if not self.ready:
+            self.start_build(current_app._get_current_object())
+            return
+        if time.monotonic() - self._checked_at <= self.refresh_seconds:
+            return
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+
+    # ------------------ Scoring ------------------
+    def similar(self, product_id):
+        """Top-N most similar products to one product, cached."""
+        top = self._top.get(product_id)
+        if top is None:
+            row = self.pairs.get(product_id, {})
+            n = self.counts[product_id]
+            top = heapq.nlargest(self.neighbors, (
+                (both / math.sqrt(n * self.counts[other]), other) for other, both in row.items()
+            ))
+            self._top[product_id] = top
+        return top
+
+    def recommend(self, consumer_id, n=10):
+        """[(product_id, score)] for products the consumer hasn't bought, best first."""
+        with self._lock:
+            basket = self.baskets.get(consumer_id)
+            if not basket:
+                return []
+            scores = Counter()
+            for p in basket:
+                for sim, q in self.similar(p):
+                    if q not in basket:
+                        scores[q] += sim
+            return [(q, round(s, 4)) for q, s in scores.most_common(n)]
+
+    def recommend_all(self, n=10):
+        """Batch scoring: {consumer_id: [(product_id, score)]} for every known consumer."""
+        with self._lock:
+            return {consumer_id: self.recommend(consumer_id, n) for consumer_id in self.baskets}
+
+
+co_occurrence = CoOccurrenceModel(
+    neighbors=Config.RECOMMENDER_NEIGHBORS,
+    refresh_seconds=Config.RECOMMENDER_REFRESH_SECONDS,
+    overlap=Config.RECOMMENDER_REFRESH_OVERLAP,
+)
+
+
+def in_stock(product_ids):
+    """The subset of product_ids that still exist and can be ordered (one query)."""
+    if not product_ids:
+        return set()
+    return {
+        row[0] for row in db.session.query(FarmerItem.id)
+        .filter(FarmerItem.id.in_(product_ids), FarmerItem.available_stock > 0)
+    }
+
+
+class CustomerTypeCache:
+    """
+    Per-process cache of get_customer_type results.
+    Returning is permanent (orders are never deleted), so it is kept for
+    good; "new" is kept for `ttl` seconds, since another worker process may
+    take the customer's first order. This process's checkout flips the
+    customer right away via mark_returning.
+    """
+
+    def __init__(self, ttl=300, max_new=100000):
+        self.ttl = ttl
+        self.max_new = max_new
+        self._returning = set()
+        self._new = {}   # consumer_id -> monotonic time it was found to have no orders
+        self._lock = threading.Lock()
+
+    def lookup(self, user_ids):
+        """({user_id: type} for cached ids, [ids that need a query])"""
+        now = time.monotonic()
+        known, missing = {}, []
+        with self._lock:
+            for uid in user_ids:
+                if uid in self._returning:
+                    known[uid] = 'old_customer'
+                elif now - self._new.get(uid, -math.inf) < self.ttl:
+                    known[uid] = 'new_customer'
+                else:
+                    missing.append(uid)
+        return known, missing
+
+    def store(self, types):
+        now = time.monotonic()
+        with self._lock:
+            for uid, kind in types.items():
+                if kind == 'old_customer':
+                    self._returning.add(uid)
+                    self._new.pop(uid, None)
+                else:
+                    self._new[uid] = now
+            if len(self._new) > self.max_new:
+                self._new = {uid: t for uid, t in self._new.items() if now - t < self.ttl}
+
+    def mark_returning(self, user_id):
+        with self._lock:
+            self._returning.add(user_id)
+            self._new.pop(user_id, None)
+
+
+customer_types = CustomerTypeCache(ttl=Config.CUSTOMER_TYPE_TTL)
+
+
+# Determine customer type
+def get_customer_type(user_id):
+    return get_customer_types([user_id])[user_id]
+
+
+def get_customer_types(user_ids, chunk_size=5000):
+    """
+    Batch get_customer_type: {user_id: 'old_customer' | 'new_customer'}.
+    Cached ids cost nothing; the rest are classified with one query per
+    chunk_size ids.
+    """
+    types, missing = customer_types.lookup(list(dict.fromkeys(user_ids)))
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('SELECT DISTINCT consumer_id FROM orders WHERE consumer_id = ANY(%s)', (chunk,))
+                returning = {row[0] for row in cur.fetchall()}
+        fresh = {uid: 'old_customer' if uid in returning else 'new_customer' for uid in chunk}
+        customer_types.store(fresh)
+        types.update(fresh)
+    return types
+
+
+def mark_returning_customer(user_id):
+    """Call after committing a customer's order."""
+    customer_types.mark_returning(user_id)
+
+
+def clear_distance_recommendations(user_id):
+    """
+    Drop a precomputed distance-based list (new-customer recommendations),
+    in the caller's transaction; the next request then computes history-based
+    ones live. Call when placing an order.
+    """
+    ConsumerRecommendation.query.filter_by(consumer_id=user_id, kind="distance").delete(synchronize_session=False)
+
+# Content-based recommendation for old customer
+def content_based_recommend(user_id, n=None):
+    """
+    Product ids the customer is likely to want, best first: products most
+    often bought by people who bought what they bought. Excludes products
+    they already bought and ones that are gone or out of stock.
+    """
+    n = n or Config.RECOMMENDER_TOP_N
+    co_occurrence.ensure_fresh()
+    candidates = co_occurrence.recommend(user_id, n * 2)   # headroom for sold-out items
+    available = in_stock([pid for pid, _ in candidates])
+    return [pid for pid, _ in candidates if pid in available][:n]
+
+
+def content_based_recommend_all(n=None):
+    """content_based_recommend for every customer with purchases: {user_id: [product ids]}."""
+    n = n or Config.RECOMMENDER_TOP_N
+    co_occurrence.refresh()
+    scored = co_occurrence.recommend_all(n * 2)
+    available = in_stock(list({pid for ranked in scored.values() for pid, _ in ranked}))
+    return {
+        user_id: [pid for pid, _ in ranked if pid in available][:n]
+        for user_id, ranked in scored.items()
+    }
+
+# Distance-based recommendation for new customer
+def blend_scores(distance_km, stock, price, sold, scale_km, weights):
+    """
+    Score candidate products in one pass; higher is better.
+    Each feature is scaled to 0..1 before weighting:
+    - distance: 1 at the customer, 0 at scale_km
+    - stock, sold: log-scaled against the best candidate
+    - price: 1 for the cheapest candidate, 0 for the dearest
+    NumPy when available, otherwise plain Python.
+    """
+    if np is not None:
+        d = np.clip(1 - np.asarray(distance_km, dtype=float) / scale_km, 0, 1)
+        st = np.log1p(np.asarray(stock, dtype=float))
+        st = st / st.max() if st.max() > 0 else st
+        po = np.log1p(np.asarray(sold, dtype=float))
+        po = po / po.max() if po.max() > 0 else po
+        pr = np.asarray(price, dtype=float)
+        span = pr.max() - pr.min()
+        pr = 1 - (pr - pr.min()) / span if span > 0 else np.ones_like(pr)
+        return (weights["distance"] * d + weights["stock"] * st
+                + weights["price"] * pr + weights["popularity"] * po)
+
+    max_st = math.log1p(max(stock))
+    max_po = math.log1p(max(sold))
+    lo, hi = min(price), max(price)
+    return [
+        weights["distance"] * min(max(1 - dk / scale_km, 0), 1)
+        + weights["stock"] * (math.log1p(st) / max_st if max_st > 0 else 0)
+        + weights["price"] * (1 - (pr - lo) / (hi - lo) if hi > lo else 1)
+        + weights["popularity"] * (math.log1p(so) / max_po if max_po > 0 else 0)
+        for dk, st, pr, so in zip(distance_km, stock, price, sold)
+    ]
+
+
+def distance_based_recommend(customer_location, n=None, k=None, radius_km=None):
+    """
+    Product ids for a customer at (lat, lon), best first, drawn from the
+    k nearest farmers within radius_km (spatial index, haversine km) and
+    ranked by blend_scores with RECOMMENDER_WEIGHTS. Candidates and their
+    recent sales come back in one query.
+    """
+    return distance_based_recommend_many({None: customer_location}, n, k, radius_km)[None]
+
+
+def distance_based_recommend_many(locations, n=None, k=None, radius_km=None):
+    """
+    distance_based_recommend for many customers: {key: (lat, lon)} ->
+    {key: [product ids]}. Nearest farmers come from the in-memory spatial
+    index; the candidates of all of them are loaded with one query, then
+    every customer is ranked over their own farmers' products.
+    """
+    n = n or Config.RECOMMENDER_TOP_N
+    k = k or Config.RECOMMENDER_NEAREST_FARMERS
+    radius_km = Config.RECOMMENDER_RADIUS_KM if radius_km is None else radius_km
+    spatial_index.ensure_fresh()
+    nearby = {}
+    for key, (lat, lon) in locations.items():
+        if lat is not None and lon is not None:
+            nearby[key] = dict(spatial_index.nearest_farmers(lat, lon, k=k, radius_km=radius_km))
+    by_farmer = _distance_candidates({f for farmer_km in nearby.values() for f in farmer_km})
+    return {
+        key: _rank_candidates(nearby.get(key), by_farmer, n, radius_km)
+        for key in locations
+    }
+
+
+def _distance_candidates(farmer_ids):
+    """{farmer_id: [(product id, price, stock, units sold recently)]} for in-stock products, one query."""
+    if not farmer_ids:
+        return {}
+    since = datetime.utcnow().date() - timedelta(days=Config.RECOMMENDER_POPULARITY_DAYS)
+    sold = (
+        select(DailyFarmerSales.product_id, func.sum(DailyFarmerSales.quantity).label("sold"))
+        .where(DailyFarmerSales.farmer_id.in_(list(farmer_ids)), DailyFarmerSales.day >= since)
+        .group_by(DailyFarmerSales.product_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(FarmerItem.id, FarmerItem.farmer_id, FarmerItem.price,
+               FarmerItem.available_stock, func.coalesce(sold.c.sold, 0))
+        .outerjoin(sold, sold.c.product_id == FarmerItem.id)
+        .where(FarmerItem.farmer_id.in_(list(farmer_ids)), FarmerItem.available_stock > 0)
+    ).all()
+    by_farmer = {}
+    for product_id, farmer_id, price, stock, units in rows:
+        by_farmer.setdefault(farmer_id, []).append((product_id, price, stock, units))
+    return by_farmer
+
+
+def _rank_candidates(farmer_km, by_farmer, n, radius_km):
+    """Top n product ids over the products of farmer_km's farmers ({farmer_id: km})."""
+    if not farmer_km:
+        return []
+    ids, distance_km, price, stock, units = [], [], [], [], []
+    for farmer_id, km in farmer_km.items():
+        for product_id, pr, st, so in by_farmer.get(farmer_id, ()):
+            ids.append(product_id)
+            distance_km.append(km)
+            price.append(pr)
+            stock.append(st)
+            units.append(so)
+    if not ids:
+        return []
+
+    scale_km = radius_km or max(distance_km) or 1.0
+    scores = blend_scores(distance_km, stock, price, units, scale_km, Config.RECOMMENDER_WEIGHTS)
+
+    if np is not None:
+        top = np.arange(len(ids))
+        if n < len(ids):
+            top = np.argpartition(-scores, n)[:n]   # O(n) selection, only the top n get sorted
+        return [ids[i] for i in top[np.argsort(-scores[top], kind="stable")].tolist()]
+    return [ids[i] for i in heapq.nlargest(n, range(len(ids)), key=scores.__getitem__)]
+
+
+def consumer_locations(consumer_ids=None):
+    """{consumer_id: (lat, lon)} from users; all consumers when ids is None."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if consumer_ids is None:
+            cur.execute("SELECT id, latitude, longitude FROM users WHERE user_type = 'consumer'")
+        else:
+            cur.execute(
+                "SELECT id, latitude, longitude FROM users WHERE user_type = 'consumer' AND id = ANY(%s)",
+                (list(consumer_ids),)
+            )
+        rows = cur.fetchall()
+        cur.close()
+    return {consumer_id: (lat, lon) for consumer_id, lat, lon in rows}
+
+
+# ------------------ Precomputed recommendations ------------------
+def live_recommend(consumer_id):
+    """(kind, product ids) computed now: history for returning customers, distance for new ones."""
+    if get_customer_type(consumer_id) == 'old_customer':
+        product_ids = content_based_recommend(consumer_id)
+        if product_ids:
+            return "history", product_ids
+    location = consumer_locations([consumer_id]).get(consumer_id)
+    if location is None:
+        return None, []
+    return "distance", distance_based_recommend(location)
+
+
+def store_recommendations(rows):
+    """Upsert [{"consumer_id", "kind", "product_ids", "computed_at"}] into consumer_recommendations."""
+    if not rows:
+        return
+    insert = postgresql.insert if db.session.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(ConsumerRecommendation).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=["consumer_id"],
+        set_={c: getattr(stmt.excluded, c) for c in ("kind", "product_ids", "computed_at")}
+    ))
+
+
+def precompute_recommendations(batch_size=1000):
+    """
+    Offline job: top-N for every consumer into consumer_recommendations.
+    Consumers are classified in batch (get_customer_types); returning ones
+    get history-based lists from one batch scoring pass, everyone else (and
+    returning customers with nothing left to suggest) distance-based lists,
+    batch_size consumers per candidate query (distance_based_recommend_many).
+    Rows are written batch_size per transaction, and rows of consumers that
+    no longer exist are removed at the end. Returns (history count, distance count).
+    """
+    started = datetime.utcnow()
+    locations = consumer_locations()
+    types = get_customer_types(locations)
+    history = content_based_recommend_all()
+    counts = {"history": 0, "distance": 0}
+    consumer_ids = list(locations)
+
+    def rows():
+        for i in range(0, len(consumer_ids), batch_size):
+            chunk = consumer_ids[i:i + batch_size]
+            by_history = {
+                consumer_id: history.get(consumer_id)
+                for consumer_id in chunk if types[consumer_id] == 'old_customer'
+            }
+            by_distance = distance_based_recommend_many({
+                consumer_id: locations[consumer_id] for consumer_id in chunk if not by_history.get(consumer_id)
+            })
+            for consumer_id in chunk:
+                if by_history.get(consumer_id):
+                    kind, product_ids = "history", by_history[consumer_id]
+                else:
+                    kind, product_ids = "distance", by_distance[consumer_id]
+                counts[kind] += 1
+                yield {"consumer_id": consumer_id, "kind": kind, "product_ids": product_ids, "computed_at": started}
+
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= batch_size:
+            store_recommendations(batch)
+            db.session.commit()
+            batch = []
+    store_recommendations(batch)
+    ConsumerRecommendation.query.filter(ConsumerRecommendation.computed_at < started).delete(synchronize_session=False)
+    db.session.commit()
+    return counts["history"], counts["distance"]
@@ -0,0 +1,176 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from reportlab.pdfgen import canvas
+from config import Config
+
+RENDER_VERSION = 2   # bump when the layout changes; part of every cache key
+
+TOP = 800
+BOTTOM = 60
+LINE = 20
+
+
+def report_digest(farmer_id, report):
+    """Content address of a farmer's PDF: same data + same layout -> same file."""
+    blob = json.dumps([RENDER_VERSION, farmer_id, report], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+def cache_path(farmer_id, digest):
+    return os.path.join(Config.REPORT_CACHE_DIR, str(int(farmer_id)), f"{digest}.pdf")
+
+
+def render_pdf(report, path):
+    """
+    Draw the report onto as many pages as it needs and write it to `path`.
+    `report` is the in-memory build_report() dict (one row per product and
+    day, not per order); long sections break onto new pages at the bottom
+    margin. The file appears atomically (temp + rename), so readers never
+    see a half-written PDF.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    pdf = canvas.Canvas(tmp, pageCompression=1)
+    pdf.setTitle("Farmer Report")
+    page = [1]
+
+    def footer():
+        pdf.setFont("Helvetica", 9)
+        pdf.drawString(50, 30, f"Page {page[0]}")
+
+    def heading(y, title):
+        if y - LINE < BOTTOM:
+            footer()
+            pdf.showPage()
+            page[0] += 1
+            y = TOP
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawString(50, y, title)
+        pdf.setFont("Helvetica", 12)
+        return y - LINE
+
+    def section(y, title, lines):
+        y = heading(y, title)
+        for line in lines:
+            if y < BOTTOM:
+                y = heading(BOTTOM, title.rstrip(":") + " (continued):")
+            pdf.drawString(60, y, line)
+            y -= LINE
+        return y - LINE
+
+    summary = report["summary"]
+    pdf.setFont("Helvetica-Bold", 20)
+    pdf.drawString(50, TOP, "KisanLink Farmer Report")
+
+    pdf.setFont("Helvetica", 14)
+    pdf.drawString(50, 760, f"Total Revenue: Rs. {summary['totalRevenue']}")
+    pdf.drawString(50, 740, f"Total Orders: {summary['totalOrders']}")
+    pdf.drawString(50, 720, f"Most Sold Product: {summary['mostSoldProduct']}")
+    pdf.drawString(50, 700, f"Low Stock Items: {summary['lowStock']}")
+
+    y = section(670, "Inventory:", (
+        f"{row['product']} - Stock: {row['stock']}" for row in report["inventoryTable"]
+    ))
+    section(y, "Revenue by Product:", (
+        f"{row['product']} - Rs. {row['value']}" for row in report["revenueBreakdown"]
+    ))
+
+    footer()
+    pdf.save()
+    os.replace(tmp, path)
+
+
+class PdfJobs:
+    """
+    Background PDF rendering on a small thread pool.
+    Jobs are identified by "<farmer_id>-<digest>", so concurrent requests
+    for the same data share one render, and a finished job is just a file
+    in the cache (which also lets other worker processes answer status
+    queries for it).
+    """
+
+    def __init__(self, workers=2, ttl=3600):
+        self.workers = workers
+        self.ttl = ttl
+        self._executor = None
+        self._jobs = {}   # job_id -> {"id", "farmer_id", "digest", "status", "error", "finished"}
+        self._lock = threading.Lock()
+
+    def submit(self, farmer_id, digest, report):
+        job_id = f"{farmer_id}-{digest}"
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] != "error":
+                return dict(job)
+            job = {"id": job_id, "farmer_id": farmer_id, "digest": digest,
+                   "status": "pending", "error": None, "finished": None}
+            self._jobs[job_id] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-pdf")
+            self._executor.submit(self._run, job, report)
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # Rendered by another process (or before a restart)?
+        farmer_id, _, digest = job_id.partition("-")
+        if farmer_id.isdigit() and digest.isalnum() and os.path.exists(cache_path(farmer_id, digest)):
+            return {"id": job_id, "farmer_id": int(farmer_id), "digest": digest, "status": "done", "error": None}
+        return None
+
+    def _run(self, job, report):
+        job["status"] = "running"
+        path = cache_path(job["farmer_id"], job["digest"])
+        try:
+            if not os.path.exists(path):
+                render_pdf(report, path)
+                prune_farmer_cache(job["farmer_id"], keep=path)
+            job["status"] = "done"
+        except Exception as e:
+            print("Report PDF render failed:", e)
+            job["status"] = "error"
+            job["error"] = str(e)
+        job["finished"] = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, job in self._jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self._jobs[job_id]
+
+
+def mark_served(path):
+    """A download link to `path` was just handed out: restart its grace period."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_farmer_cache(farmer_id, keep):
+    """
+    Drop a farmer's superseded PDFs. A file whose link went out within the
+    last REPORT_PDF_GRACE seconds (mtime, see mark_served) stays, so a
+    client that was just told "done" can still download it.
+    """
+    cutoff = time.time() - Config.REPORT_PDF_GRACE
+    for path in glob.glob(os.path.join(Config.REPORT_CACHE_DIR, str(int(farmer_id)), "*.pdf")):
+        if path == keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+pdf_jobs = PdfJobs(workers=Config.REPORT_PDF_WORKERS, ttl=Config.REPORT_JOB_TTL)
@@ -0,0 +1,165 @@
+import cProfile
+import hashlib
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import click
+from flask import g, request
+from config import Config
+
+HEADER = "X-Profile"            # value: "<expires>.<hmac>", see profile_token()
+SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+# -----------------------------
+# Trigger: signed header or sampling
+# -----------------------------
+def _secret():
+    return (Config.REQUEST_PROFILER_SECRET or Config.SECRET_KEY).encode()
+
+
+def profile_token(ttl=600):
+    """Header value that asks for a profile of any request until it expires."""
+    expires = str(int(time.time()) + ttl)
+    sig = hmac.new(_secret(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{sig}"
+
+
+def valid_token(value):
+    expires, _, sig = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(_secret(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(sig, expected)
+
+
+def _triggered():
+    value = request.headers.get(HEADER)
+    if value is not None:
+        return valid_token(value)
+    rate = Config.REQUEST_PROFILER_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+# -----------------------------
+# Profilers (one request, one thread)
+# -----------------------------
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the request thread's stack every `interval` seconds from a helper
+    thread and counts identical stacks, i.e. collapsed-stack format
+    ("root;caller;callee count"), which flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path + ".folded", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path + ".folded"
+
+
+class DeterministicProfiler:
+    """cProfile for the request thread only; written as a pstats file (snakeviz, gprof2dot)."""
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, path):
+        self._profile.dump_stats(path + ".prof")
+        return path + ".prof"
+
+
+# -----------------------------
+# Flask hooks
+# -----------------------------
+def _start_request():
+    if not _triggered():
+        return
+    if Config.REQUEST_PROFILER_MODE == "cprofile":
+        profiler = DeterministicProfiler()
+    else:
+        profiler = StackSampler(Config.REQUEST_PROFILER_INTERVAL_MS / 1000)
+    g.request_profiler = (profiler, time.perf_counter())
+    profiler.start()
+
+
+def _finish_request(response):
+    entry = g.pop("request_profiler", None)
+    if entry is None:
+        return response
+    profiler, started = entry
+    profiler.stop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    endpoint = SAFE_NAME.sub("_", request.endpoint or "unmatched")
+    folder = os.path.join(Config.REQUEST_PROFILER_DIR, endpoint)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}-{elapsed_ms:.0f}ms"
+        path = profiler.write(os.path.join(folder, name))
+        response.headers["X-Profile-File"] = os.path.relpath(path, Config.REQUEST_PROFILER_DIR)
+    except Exception as e:
+        print("Request profile write failed:", e)
+    return response
+
+
+def init_request_profiler(app):
+    """
+    Profile single requests on demand (REQUEST_PROFILER_ENABLED).
+    A request is profiled when it carries a valid signed X-Profile header
+    (`flask profile-token`) or wins the REQUEST_PROFILER_SAMPLE_RATE draw.
+    Output goes to REQUEST_PROFILER_DIR/<endpoint>/: a collapsed-stack
+    .folded file ("sample" mode) or a pstats .prof file ("cprofile" mode).
+    Nothing is registered while disabled; untriggered requests cost one
+    header lookup.
+    """
+    @app.cli.command("profile-token")
+    @click.option("--ttl", type=int, default=600, help="Seconds the token stays valid")
+    def profile_token_command(ttl):
+        """Print an X-Profile header value for profiling requests."""
+        print(f"{HEADER}: {profile_token(ttl)}")
+
+    if not Config.REQUEST_PROFILER_ENABLED:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
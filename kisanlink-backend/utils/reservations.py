@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+from extensions import db
+from models_stock_hold import StockHold
+
+
+def held_quantities(product_ids, exclude_consumer=None):
+    """
+    {product_id: quantity held by live (unexpired) holds}, in one grouped query.
+    Holds of `exclude_consumer` are left out so a consumer's own cart
+    doesn't count against them.
+    """
+    if not product_ids:
+        return {}
+    query = (
+        db.session.query(StockHold.product_id, db.func.sum(StockHold.quantity))
+        .filter(StockHold.product_id.in_(list(product_ids)), StockHold.expires_at > datetime.utcnow())
+    )
+    if exclude_consumer is not None:
+        query = query.filter(StockHold.consumer_id != exclude_consumer)
+    return {pid: int(qty) for pid, qty in query.group_by(StockHold.product_id).all()}
+
+
+def available_to_sell(product, consumer_id=None):
+    """Stock minus what other consumers currently hold."""
+    return product.available_stock - held_quantities([product.id], consumer_id).get(product.id, 0)
+
+
+def place_holds(consumer_id, quantities):
+    """
+    Create or refresh the consumer's holds, {product_id: quantity}.
+    Existing holds are loaded with one query. Caller commits.
+    """
+    if not quantities:
+        return
+    expires_at = datetime.utcnow() + timedelta(seconds=Config.STOCK_HOLD_TTL)
+    existing = {
+        h.product_id: h
+        for h in StockHold.query.filter(
+            StockHold.consumer_id == consumer_id,
+            StockHold.product_id.in_(list(quantities))
+        )
+    }
+    for product_id, quantity in quantities.items():
+        hold = existing.get(product_id)
+        if hold:
+            hold.quantity = quantity
+            hold.expires_at = expires_at
+        else:
+            db.session.add(StockHold(consumer_id=consumer_id, product_id=product_id,
+                                     quantity=quantity, expires_at=expires_at))
+
+
+def release_holds(consumer_id, product_ids):
+    """Drop the consumer's holds on these products. Caller commits."""
+    if product_ids:
+        StockHold.query.filter(
+            StockHold.consumer_id == consumer_id,
+            StockHold.product_id.in_(list(product_ids))
+        ).delete(synchronize_session=False)
+
+
+def sweep_expired():
+    """Bulk-delete expired holds; returns how many were removed."""
+    removed = StockHold.query.filter(StockHold.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+_sweeper_lock = threading.Lock()
+_sweeper_pid = None   # process the sweeper thread was started in (threads don't survive fork)
+
+
+def start_sweeper(app):
+    """
+    Background thread that runs sweep_expired every STOCK_HOLD_SWEEP_SECONDS,
+    at most one per process (later calls are no-ops). Expired holds are
+    already ignored by held_quantities; this only keeps the table (and its
+    indexes) small.
+    """
+    global _sweeper_pid
+    with _sweeper_lock:
+        if _sweeper_pid == os.getpid():
+            return None
+        _sweeper_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(Config.STOCK_HOLD_SWEEP_SECONDS)
+            try:
+                with app.app_context():
+                    sweep_expired()
+            except Exception as e:
+                print("Stock hold sweep failed:", e)
+
+    thread = threading.Thread(target=run, name="stock-hold-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_sweeper(app):
+    """
+    Start the sweeper on the first request a process serves, so CLI commands,
+    scripts importing the app and the master of a pre-fork server don't run one.
+    STOCK_HOLD_SWEEPER_ENABLED = False leaves it to an external job
+    (sweep_expired) instead.
+    """
+    if not Config.STOCK_HOLD_SWEEPER_ENABLED:
+        return
+
+    @app.before_request
+    def _start_sweeper():
+        if _sweeper_pid != os.getpid():
+            start_sweeper(app)
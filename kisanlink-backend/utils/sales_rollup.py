@@ -0,0 +1,132 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models_sales_rollup import DailyFarmerOrders, DailyFarmerSales
+
+
+def _upsert(model, rows, keys, counters):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE SET counter = counter + excluded.counter"""
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in counters}
+    )
+    db.session.execute(stmt)
+
+
+def record_sales(lines, day):
+    """
+    Add freshly written order lines to the rollups, in the caller's transaction.
+    lines: [(order_id, farmer_id, product_id, quantity, price)]
+    One multi-row upsert per rollup table, rows in conflict-key order so two
+    checkouts touching the same farmers lock their rows in the same order
+    (no deadlock).
+    """
+    if not lines:
+        return
+    sales, orders = {}, {}
+    for order_id, farmer_id, product_id, quantity, price in lines:
+        s = sales.setdefault((farmer_id, product_id), [0, 0.0])
+        s[0] += quantity
+        s[1] += quantity * price
+        o = orders.setdefault(farmer_id, [set(), 0.0])
+        o[0].add(order_id)
+        o[1] += quantity * price
+
+    _upsert(DailyFarmerSales, [
+        {"farmer_id": f, "product_id": p, "day": day, "quantity": q, "revenue": r}
+        for (f, p), (q, r) in sorted(sales.items())
+    ], ["farmer_id", "product_id", "day"], ["quantity", "revenue"])
+    _upsert(DailyFarmerOrders, [
+        {"farmer_id": f, "day": day, "order_count": len(ids), "revenue": r}
+        for f, (ids, r) in sorted(orders.items())
+    ], ["farmer_id", "day"], ["order_count", "revenue"])
+
+
+# Rollup contents recomputed from the raw tables
+RAW_SALES = """
+    SELECT oi.farmer_id, oi.product_id, DATE(o.created_at) AS day,
+           SUM(oi.quantity) AS quantity, SUM(oi.quantity * oi.price) AS revenue
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    {where}
+    GROUP BY oi.farmer_id, oi.product_id, DATE(o.created_at)
+"""
+RAW_ORDERS = """
+    SELECT oi.farmer_id, DATE(o.created_at) AS day,
+           COUNT(DISTINCT oi.order_id) AS order_count, SUM(oi.quantity * oi.price) AS revenue
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    {where}
+    GROUP BY oi.farmer_id, DATE(o.created_at)
+"""
+
+
+def backfill(farmer_id=None):
+    """
+    Rebuild the rollups from order_items/orders (all farmers, or one).
+    Safe while checkouts run: each farmer is rebuilt in its own short
+    transaction, so writers only wait for one farmer's rebuild at a time.
+    """
+    if farmer_id is not None:
+        _rebuild_farmer(farmer_id)
+        return
+    farmer_ids = db.session.execute(text("""
+        SELECT DISTINCT farmer_id FROM order_items
+        UNION SELECT farmer_id FROM daily_farmer_orders
+        UNION SELECT farmer_id FROM daily_farmer_sales
+    """)).scalars().all()
+    db.session.commit()
+    for fid in sorted(farmer_ids):
+        _rebuild_farmer(fid)
+
+
+def _rebuild_farmer(farmer_id):
+    """
+    One farmer's rollup rows, rebuilt in one transaction.
+    On Postgres the rollup tables are locked against writers first: a
+    checkout that already upserted has committed before the rebuild reads,
+    one that hasn't waits and adds its lines on top afterwards.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        db.session.execute(text("LOCK TABLE daily_farmer_sales, daily_farmer_orders IN EXCLUSIVE MODE"))
+    where = "WHERE oi.farmer_id = :farmer_id"
+    params = {"farmer_id": farmer_id}
+    for model in (DailyFarmerSales, DailyFarmerOrders):
+        model.query.filter(model.farmer_id == farmer_id).delete(synchronize_session=False)
+    db.session.execute(text(
+        "INSERT INTO daily_farmer_sales (farmer_id, product_id, day, quantity, revenue) "
+        + RAW_SALES.format(where=where)), params)
+    db.session.execute(text(
+        "INSERT INTO daily_farmer_orders (farmer_id, day, order_count, revenue) "
+        + RAW_ORDERS.format(where=where)), params)
+    db.session.commit()
+
+
+def reconcile():
+    """
+    Compare the rollups with a fresh aggregate of the raw tables.
+    Returns the farmer ids whose rollups differ.
+    """
+    mismatched = set()
+    for raw, table, keys, values in (
+        (RAW_SALES, "daily_farmer_sales", ("farmer_id", "product_id", "day"), ("quantity", "revenue")),
+        (RAW_ORDERS, "daily_farmer_orders", ("farmer_id", "day"), ("order_count", "revenue")),
+    ):
+        cols = ", ".join(keys + values)
+        expected = {
+            tuple(str(v) for v in row[:len(keys)]): row[len(keys):]
+            for row in db.session.execute(text(raw.format(where="")))
+        }
+        actual = {
+            tuple(str(v) for v in row[:len(keys)]): row[len(keys):]
+            for row in db.session.execute(text(f"SELECT {cols} FROM {table}"))
+        }
+        for key in expected.keys() | actual.keys():
+            e, a = expected.get(key), actual.get(key)
+            if e is None or a is None or e[0] != a[0] or abs(float(e[1]) - float(a[1])) > 0.01:
+                mismatched.add(int(key[0]))
+    return sorted(mismatched)
@@ -0,0 +1,269 @@
+import math
+import threading
+import time
+
+from config import Config
+from db import db_connection
+from utils.distance import haversine_many, nearest
+
+KM_PER_DEG = 111.0
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid (geohash-style buckets) of id -> (lat, lon).
+    Radius and k-nearest queries only look at cells around the origin,
+    so cost depends on local density, not on the total number of points.
+    Not thread-safe on its own; SpatialIndex holds the lock.
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self.cells = {}    # (row, col) -> set of ids
+        self.points = {}   # id -> (lat, lon)
+        self.bounds = None   # (min_row, max_row, min_col, max_col) of cells ever occupied
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def insert(self, key, lat, lon):
+        self.remove(key)
+        if lat is None or lon is None:
+            return
+        self.points[key] = (lat, lon)
+        row, col = self._cell(lat, lon)
+        self.cells.setdefault((row, col), set()).add(key)
+        if self.bounds is None:
+            self.bounds = (row, row, col, col)
+        else:
+            r0, r1, c0, c1 = self.bounds
+            self.bounds = (min(r0, row), max(r1, row), min(c0, col), max(c1, col))
+
+    def remove(self, key):
+        old = self.points.pop(key, None)
+        if old is None:
+            return
+        cell = self._cell(*old)
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+        if not self.cells:
+            self.bounds = None
+
+    def _ring(self, row, col, r):
+        """Cells at Chebyshev distance exactly r from (row, col)."""
+        if r == 0:
+            yield row, col
+            return
+        for c in range(col - r, col + r + 1):
+            yield row - r, c
+            yield row + r, c
+        for rr in range(row - r + 1, row + r):
+            yield rr, col - r
+            yield rr, col + r
+
+    def rank(self, lat, lon, keys, limit=None, radius_km=None):
+        """Rank the given ids by distance from (lat, lon)."""
+        keys = list(keys)
+        pts = [self.points[k] for k in keys]
+        distances = haversine_many(lat, lon, [p[0] for p in pts], [p[1] for p in pts])
+        return [(keys[i], float(distances[i])) for i in nearest(distances, limit=limit, radius_km=radius_km)]
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """[(id, distance_km)] within radius_km, nearest first."""
+        dlat = radius_km / KM_PER_DEG
+        dlon = radius_km / (KM_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+        row0, col0 = self._cell(lat - dlat, lon - dlon)
+        row1, col1 = self._cell(lat + dlat, lon + dlon)
+
+        # A huge radius would touch more cells than exist; just scan occupied ones
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            keys = [k for (r, c), b in self.cells.items()
+                    if row0 <= r <= row1 and col0 <= c <= col1 for k in b]
+        else:
+            keys = [k for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)
+                    for k in self.cells.get((r, c), ())]
+        return self.rank(lat, lon, keys, limit=limit, radius_km=radius_km)
+
+    def knn(self, lat, lon, k, radius_km=None):
+        """[(id, distance_km)] of the k nearest points, nearest first."""
+        if k <= 0 or not self.points:
+            return []
+        row, col = self._cell(lat, lon)
+        # Bounds only grow (kept up by insert), so this may overshoot after removals;
+        # the ring loop below stops early anyway
+        r0, r1, c0, c1 = self.bounds
+        max_r = max(abs(row - r0), abs(row - r1), abs(col - c0), abs(col - c1))
+
+        keys = []
+        for r in range(max_r + 1):
+            # Probing more empty cells than there are occupied ones: plain scan is cheaper
+            if (2 * r + 1) ** 2 > 4 * len(self.cells):
+                return self.rank(lat, lon, self.points, limit=k, radius_km=radius_km)
+
+            for cell in self._ring(row, col, r):
+                keys.extend(self.cells.get(cell, ()))
+
+            # Anything outside the rings seen so far is at least r cell widths away
+            # (cells narrow in longitude as latitude grows)
+            covered_km = r * self.cell_deg * KM_PER_DEG * \
+                max(math.cos(math.radians(min(abs(lat) + r * self.cell_deg, 89.0))), 0.01)
+            if len(keys) >= k:
+                ranked = self.rank(lat, lon, keys, limit=k, radius_km=radius_km)
+                if len(ranked) == k and ranked[-1][1] <= covered_km:
+                    return ranked
+            if radius_km is not None and covered_km > radius_km:
+                break
+        return self.rank(lat, lon, keys, limit=k, radius_km=radius_km)
+
+
+# Ids and id-weighted sums, so a moved farmer, a product handed to another farmer
+# or a delete + insert that keeps the row count all change it. Coordinates are
+# compared in integer micro-degrees (exact, unlike float sums).
+FINGERPRINT_QUERY = """
+    SELECT p.n, p.id_sum, p.owner_sum, f.n, f.lat_sum, f.lon_sum
+    FROM (SELECT COUNT(*) AS n,
+                 COALESCE(SUM(fi.id::bigint), 0) AS id_sum,
+                 COALESCE(SUM(fi.id::bigint * fi.farmer_id), 0) AS owner_sum
+          FROM farmer_items fi
+          JOIN users u ON u.id = fi.farmer_id) p,
+         (SELECT COUNT(*) AS n,
+                 COALESCE(SUM(id::bigint * ROUND(latitude * 1000000)::bigint), 0) AS lat_sum,
+                 COALESCE(SUM(id::bigint * ROUND(longitude * 1000000)::bigint), 0) AS lon_sum
+          FROM users
+          WHERE user_type='farmer' AND latitude IS NOT NULL AND longitude IS NOT NULL) f
+"""
+
+
+class SpatialIndex:
+    """
+    Per-process index of farmer and product locations.
+    - farmers: users.id -> farmer coordinates
+    - products: farmer_items.id -> coordinates of the owning farmer
+      (same coordinates /consumer/nearby-products reports distances for)
+    Built from the DB on first use, kept up to date by the farmer product
+    routes, and rebuilt when a periodic fingerprint check shows it has drifted
+    (e.g. writes handled by another worker process).
+    """
+
+    def __init__(self, cell_deg=0.05, drift_check_seconds=60):
+        self.cell_deg = cell_deg
+        self.drift_check_seconds = drift_check_seconds
+        self._lock = threading.RLock()
+        self._build_lock = threading.RLock()
+        self.farmers = GridIndex(cell_deg)
+        self.products = GridIndex(cell_deg)
+        self.product_farmer = {}   # product id -> farmer id
+        self._built = False
+        self._checked_at = 0.0
+
+    # ------------------ Build / drift ------------------
+    def rebuild(self):
+        """Reload everything from the DB and swap it in."""
+        with self._build_lock, db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, latitude, longitude FROM users WHERE user_type='farmer'")
+            farmers = GridIndex(self.cell_deg)
+            for farmer_id, lat, lon in cur.fetchall():
+                farmers.insert(farmer_id, lat, lon)
+
+            cur.execute("""
+                SELECT fi.id, fi.farmer_id, u.latitude, u.longitude
+                FROM farmer_items fi
+                JOIN users u ON u.id = fi.farmer_id
+            """)
+            products = GridIndex(self.cell_deg)
+            product_farmer = {}
+            for product_id, farmer_id, lat, lon in cur.fetchall():
+                product_farmer[product_id] = farmer_id
+                products.insert(product_id, lat, lon)
+            cur.close()
+
+        with self._lock:
+            self.farmers, self.products, self.product_farmer = farmers, products, product_farmer
+            self._built = True
+            self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Build on first use; afterwards compare fingerprints with the DB every drift_check_seconds."""
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self.rebuild()
+            return
+        if time.monotonic() - self._checked_at < self.drift_check_seconds:
+            return
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(FINGERPRINT_QUERY)
+            db_fingerprint = tuple(int(v) for v in cur.fetchone())
+            cur.close()
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            drifted = db_fingerprint != self.fingerprint()
+        if drifted:
+            print("Spatial index drifted from DB, rebuilding")
+            self.rebuild()
+
+    def fingerprint(self):
+        """Same numbers as FINGERPRINT_QUERY, from what the index holds (call with the lock held)."""
+        farmers = self.farmers.points.items()
+        return (
+            len(self.product_farmer),
+            sum(self.product_farmer),
+            sum(pid * fid for pid, fid in self.product_farmer.items()),
+            len(self.farmers),
+            sum(fid * round(lat * 1_000_000) for fid, (lat, _) in farmers),
+            sum(fid * round(lon * 1_000_000) for fid, (_, lon) in farmers),
+        )
+
+    # ------------------ Incremental updates ------------------
+    def set_farmer(self, farmer_id, lat, lon):
+        """Add/move a farmer and every product they own."""
+        with self._lock:
+            self.farmers.insert(farmer_id, lat, lon)
+            for product_id, owner in self.product_farmer.items():
+                if owner == farmer_id:
+                    self.products.insert(product_id, lat, lon)
+
+    def set_product(self, product_id, farmer_id, lat=None, lon=None):
+        """Add/update a product. Coordinates default to the farmer's."""
+        with self._lock:
+            if lat is None or lon is None:
+                lat, lon = self.farmers.points.get(farmer_id, (None, None))
+            self.product_farmer[product_id] = farmer_id
+            self.products.insert(product_id, lat, lon)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self.product_farmer.pop(product_id, None)
+            self.products.remove(product_id)
+
+    # ------------------ Queries ------------------
+    def nearby_products(self, lat, lon, radius_km=None, limit=None):
+        """[(product_id, distance_km)] nearest first."""
+        with self._lock:
+            if radius_km is not None:
+                return self.products.within(lat, lon, radius_km, limit=limit)
+            if limit is not None:
+                return self.products.knn(lat, lon, limit)
+            return self.products.rank(lat, lon, self.products.points)
+
+    def nearest_farmers(self, lat, lon, k=1, radius_km=None):
+        """[(farmer_id, distance_km)] nearest first."""
+        with self._lock:
+            return self.farmers.knn(lat, lon, k, radius_km=radius_km)
+
+
+# Shared per-process index used by the consumer, farmer and recommend routes
+spatial_index = SpatialIndex(
+    cell_deg=Config.SPATIAL_CELL_DEG,
+    drift_check_seconds=Config.SPATIAL_DRIFT_CHECK_SECONDS,
+)
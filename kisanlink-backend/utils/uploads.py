@@ -0,0 +1,81 @@
+import mimetypes
+import os
+import re
+
+from flask import Response, abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from config import Config
+
+# <sha256>.<ext> originals and <sha256>_<variant>.webp (utils.images): never change once written
+HASHED_NAME = re.compile(r"^([0-9a-f]{64})(?:_[a-z0-9]+)?\.[a-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"   # legacy names can be overwritten; clients revalidate with the ETag
+
+# Precompressed siblings, best first: photo.svg.br / photo.svg.gz next to photo.svg
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepts(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def _precompressed(path):
+    """(path to send, Content-Encoding or None), honouring Accept-Encoding."""
+    for encoding, suffix in ENCODINGS:
+        if os.path.isfile(path + suffix) and _accepts(encoding):
+            return path + suffix, encoding
+    return path, None
+
+
+def serve_upload(filename):
+    """
+    Serve a file from UPLOAD_FOLDER.
+    - Content-hashed names get a year-long immutable Cache-Control and the
+      hash as a strong ETag; other names are revalidated every time
+    - Conditional requests (If-None-Match / If-Modified-Since) and Range
+      requests are answered by Werkzeug (304 / 206)
+    - A .br/.gz sibling is sent instead when the client accepts it
+    - UPLOAD_SERVE_MODE "x-accel" (nginx) or "x-sendfile" (Apache, lighttpd)
+      hands the transfer to the front server; the worker only sets headers
+    """
+    path = safe_join(Config.UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    name = os.path.basename(path)
+    hashed = HASHED_NAME.match(name)
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    send_path, encoding = _precompressed(path)
+
+    if hashed:
+        etag = hashed.group(0) if encoding is None else f"{hashed.group(0)}-{encoding}"
+    else:
+        stat = os.stat(send_path)
+        etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    mode = Config.UPLOAD_SERVE_MODE
+    if mode == "x-accel":
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            # nginx serves the bytes (and handles Range) from an internal location
+            resp = Response(mimetype=mimetype)
+            resp.headers["X-Accel-Redirect"] = Config.UPLOAD_ACCEL_PREFIX + os.path.relpath(send_path, Config.UPLOAD_FOLDER)
+        resp.set_etag(etag)
+    else:
+        resp = send_file(
+            send_path, request.environ,
+            mimetype=mimetype,
+            etag=etag,
+            use_x_sendfile=(mode == "x-sendfile"),
+            response_class=current_app.response_class,
+        )
+
+    resp.headers["Cache-Control"] = IMMUTABLE if hashed else REVALIDATE
+    if encoding is not None:
+        resp.headers["Content-Encoding"] = encoding
+    if any(os.path.isfile(path + suffix) for _, suffix in ENCODINGS):
+        resp.vary.add("Accept-Encoding")
+    return resp
@@ -10,6 +10,7 @@ const Cart = () => {
   const [selectedItems, setSelectedItems] = useState({});
   const [orderPlaced, setOrderPlaced] = useState(false);
   const [orderDetails, setOrderDetails] = useState([]);
+  const [failedItems, setFailedItems] = useState([]);
 
   const fetchCart = async () => {
     try {
@@ -38,7 +39,7 @@ const Cart = () => {
     if (newQty < item.min_order_qty || newQty > item.available_stock) return;
 
     try {
-      const res = await fetch(`${BACKEND_URL}/cart/${item.id}`, {
+      const res = await fetch(`${BACKEND_URL}/cart/${item.id}?delta=1`, {
         method: "PUT",
         credentials: "include",
         headers: { "Content-Type": "application/json" },
@@ -58,7 +59,7 @@ const Cart = () => {
   const removeItem = async (item) => {
     if (!window.confirm("Remove this item?")) return;
     try {
-      const res = await fetch(`${BACKEND_URL}/cart/${item.id}`, {
+      const res = await fetch(`${BACKEND_URL}/cart/${item.id}?delta=1`, {
         method: "DELETE",
         credentials: "include",
       });
@@ -89,6 +90,7 @@ const Cart = () => {
 
       if (res.ok) {
         setOrderDetails(data.order_details);
+        setFailedItems(data.failed || []);   // status "partial": these stay in the cart
         setOrderPlaced(true);
       } else alert(data.message);
     } catch (err) {
@@ -139,7 +141,7 @@ const Cart = () => {
                 <img
                   src={
                     item.photo_path
-                      ? `${BACKEND_URL}/uploads/${item.photo_path}`
+                      ? `${BACKEND_URL}/uploads/${item.thumb_path || item.photo_path}`
                       : "https://via.placeholder.com/80"
                   }
                   alt={item.item_name}
@@ -186,7 +188,9 @@ const Cart = () => {
       {orderPlaced && (
         <div className="fixed inset-0 bg-black bg-opacity-50 flex items-center justify-center z-50">
           <div className="bg-white p-6 rounded shadow-lg w-96">
-            <h2 className="text-xl font-bold mb-4">Order Placed!</h2>
+            <h2 className="text-xl font-bold mb-4">
+              {failedItems.length ? "Order Partially Placed" : "Order Placed!"}
+            </h2>
             <ul className="mb-4">
               {orderDetails.map((i) => (
                 <li key={i.item_name}>
@@ -194,6 +198,18 @@ const Cart = () => {
                 </li>
               ))}
             </ul>
+            {failedItems.length > 0 && (
+              <>
+                <p className="font-semibold text-red-600 mb-1">Not ordered (still in your cart):</p>
+                <ul className="mb-4 text-red-600">
+                  {failedItems.map((f) => (
+                    <li key={f.id}>
+                      {f.item_name || "Unavailable item"} - {f.message}
+                    </li>
+                  ))}
+                </ul>
+              </>
+            )}
             <button onClick={handleModalOk} className="bg-green-600 text-white py-2 px-4 rounded hover:bg-green-700">
               OK
             </button>
@@ -81,11 +81,17 @@ const Dashboard = () => {
 
     const fetchProducts = async () => {
       try {
-        const res = await fetch("http://localhost:5001/products/farmer-items", {
-          credentials: "include",
-        });
-        if (!res.ok) throw new Error("Failed to fetch products");
-        const data = await res.json();
+        // Catalog is paginated: follow next_cursor until the last page
+        const data = [];
+        let cursor = null;
+        do {
+          const url = "http://localhost:5001/products/farmer-items?limit=200" + (cursor ? `&cursor=${cursor}` : "");
+          const res = await fetch(url, { credentials: "include" });
+          if (!res.ok) throw new Error("Failed to fetch products");
+          const page = await res.json();
+          data.push(...page.items);
+          cursor = page.next_cursor;
+        } while (cursor);
 
         const withDistance = data.map((item) => {
           const uLat = parseFloat(user.latitude);
@@ -286,7 +292,7 @@ const ProductCard = ({ product, addToCart }) => {
         <img
           src={
             product.photo_path
-              ? `http://localhost:5001/uploads/${product.photo_path}`
+              ? `http://localhost:5001/uploads/${product.thumb_path || product.photo_path}`
               : "https://via.placeholder.com/150"
           }
           alt={product.item_name}
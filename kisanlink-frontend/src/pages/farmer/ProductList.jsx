@@ -147,7 +147,7 @@ const ProductList = () => {
                   )
                 ) : p.photo_path ? (
                   <img
-                    src={`http://localhost:5001/uploads/${p.photo_path}`}
+                    src={`http://localhost:5001/uploads/${p.thumb_path || p.photo_path}`}
                     alt={p.item_name}
                     className="w-16 h-16 mx-auto"
                   />
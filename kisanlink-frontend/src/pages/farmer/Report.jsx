@@ -68,10 +68,22 @@ function Report() {
     fetchReport();
   }, [farmerId]);
 
-  // Open PDF in new tab
-  const downloadPDF = () => {
+  // PDF is rendered in the background: start (or reuse) a job, poll it, then open the file
+  const downloadPDF = async () => {
     if (!farmerId) return;
-    window.open(`http://localhost:5001/api/farmer/report/pdf/${farmerId}`, "_blank");
+    try {
+      let res = await axios.post(`http://localhost:5001/api/farmer/report/pdf/${farmerId}/jobs`, {}, {
+        withCredentials: true
+      });
+      while (res.data.status === "pending" || res.data.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        res = await axios.get(`http://localhost:5001${res.data.status_url}`, { withCredentials: true });
+      }
+      window.open(`http://localhost:5001${res.data.download_url}`, "_blank");
+    } catch (err) {
+      console.error("Failed to generate PDF:", err);
+      alert("Failed to generate the PDF report");
+    }
   };
 
   if (loading) return <p className="p-6">Loading report...</p>;
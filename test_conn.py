@@ -1,8 +1,7 @@
-from db import get_db_connection
+from db import db_connection
 
-conn = get_db_connection()
-if conn:
-    print("Database connected successfully!")
-    conn.close()
-else:
-    print("Failed to connect to database.")
+try:
+    with db_connection() as conn:
+        print("Database connected successfully!")
+except Exception as e:
+    print("Failed to connect to database.", e)